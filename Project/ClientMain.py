@@ -1,8 +1,179 @@
+import os
 import sys
+import json
+import time
+import uuid
+import random
+import threading
 import requests
 from PyQt5 import uic
 from PyQt5.QtWidgets import QApplication, QMainWindow
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+STREAM_RECONNECT_SECONDS = 2  # how long to wait before trying to reconnect to /stream after it drops.
+STREAM_READ_TIMEOUT = 30  # the server sends a keep-alive every 15 seconds, so a silent stream this long is dead.
+REQUEST_TIMEOUT = (2, 3)  # connect and read timeouts (seconds) for the /delta and /query requests.
+COALESCE_WINDOW = 0.05  # clicks within this many seconds of each other are sent as one delta.
+RETRY_BASE_DELAY = 0.5  # the first wait (seconds) before resending a delta that failed, it doubles every time after that.
+RETRY_MAX_DELAY = 10  # the longest wait between retries.
+MAX_DELTA = 1000  # the largest delta the server's /delta accepts, more clicks than this are sent in several deltas.
+
+
+# This class holds the signals the request worker uses to hand results back to the GUI thread.
+class TransportSignals(QObject):
+    counterReceived = pyqtSignal(int)
+    requestFailed = pyqtSignal(str)
+
+
+# This class reads the counter from /query on a background thread so the window never freezes waiting on the network.
+# It reuses one requests.Session so the connection to the server stays open (keep-alive) and every request has a timeout.
+# Queries asked for while one is already waiting are merged into it. (Button presses go through CounterOutbox.)
+class CounterTransport:
+    def __init__(self, serverUrl):
+        self.serverUrl = serverUrl
+        self.signals = TransportSignals()
+        self.session = requests.Session()
+        self.queryRequested = threading.Event()  # set while a /query is waiting, so polls don't pile up.
+        self.keepRunning = True
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+
+    def Start(self):
+        self.thread.start()
+
+    def Stop(self):
+        self.keepRunning = False
+        self.queryRequested.set()  # wakes the worker up so it can exit.
+
+    # this function asks for a /query, unless one is already waiting to be sent.
+    def Query(self):
+        self.queryRequested.set()
+
+    # this function sends a /query every time one was asked for, over the shared session.
+    def Run(self):
+        while True:
+            self.queryRequested.wait()
+            if not self.keepRunning:
+                break
+            self.queryRequested.clear()
+            try:
+                response = self.session.get(f"{self.serverUrl}/query", timeout=REQUEST_TIMEOUT)
+                if response.status_code == 200:
+                    data = response.json()  # Converts the JSON response to a dictionary.
+                    self.signals.counterReceived.emit(data.get('counter'))
+            except Exception:
+                pass  # query errors are ignored since the next poll will just try again.
+
+        self.session.close()
+
+
+# This class holds the signals the stream listener uses to talk to the GUI thread.
+class StreamSignals(QObject):
+    counterChanged = pyqtSignal(int)
+    connectionChanged = pyqtSignal(bool)
+
+
+# This class collects the button presses and sends them to the server's /delta route from a background thread.
+# Clicks that come in within COALESCE_WINDOW are merged into one delta (like +3). If the server can't be reached the delta
+# is kept and resent with a growing delay, always with the same idempotency key so the server applies it exactly once.
+# Clicks made while a delta is being retried are collected into the next one.
+class CounterOutbox:
+    def __init__(self, serverUrl):
+        self.serverUrl = serverUrl
+        self.signals = TransportSignals()
+        self.session = requests.Session()
+        self.condition = threading.Condition()
+        self.pendingDelta = 0  # merged clicks that haven't been sent yet.
+        self.keepRunning = True
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+
+    def Start(self):
+        self.thread.start()
+
+    def Stop(self):
+        with self.condition:
+            self.keepRunning = False
+            self.condition.notify()
+
+    # this function records a click (+1 or -1). it only touches memory so the button never waits on the network.
+    def Add(self, delta):
+        with self.condition:
+            self.pendingDelta += delta
+            self.condition.notify()
+
+    # this function waits for clicks, merges them and sends each delta until the server has accepted it.
+    def Run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pendingDelta != 0 or not self.keepRunning)
+                if not self.keepRunning:
+                    break
+
+            time.sleep(COALESCE_WINDOW)  # gives quick follow-up clicks time to be merged into this delta.
+            with self.condition:
+                # anything over the server's limit stays pending and goes out in the next delta.
+                delta = max(-MAX_DELTA, min(MAX_DELTA, self.pendingDelta))
+                self.pendingDelta -= delta
+            if delta != 0:  # an increment and a decrement can cancel each other out.
+                self.SendDelta(delta, uuid.uuid4().hex)
+
+        self.session.close()
+
+    # this function keeps sending one delta, waiting longer after every failure, until the server answers.
+    def SendDelta(self, delta, key):
+        retryDelay = RETRY_BASE_DELAY
+        while self.keepRunning:
+            try:
+                response = self.session.post(f"{self.serverUrl}/delta", json={'delta': delta, 'key': key}, timeout=REQUEST_TIMEOUT)
+                if response.status_code == 200:
+                    self.signals.counterReceived.emit(response.json().get('counter'))
+                    return
+                if 400 <= response.status_code < 500:
+                    # the server will never accept this one, so retrying won't help.
+                    self.signals.requestFailed.emit(f"Post Error: server rejected delta {delta:+d} ({response.status_code})")
+                    return
+                error = f"server returned {response.status_code}"
+            except Exception as e:
+                error = e
+
+            self.signals.requestFailed.emit(f"Post Error: {error}, retrying {delta:+d} in {retryDelay:.1f}s")
+            time.sleep(retryDelay * random.uniform(1.0, 1.25))  # a bit of randomness so clients don't all retry together.
+            retryDelay = min(retryDelay * 2, RETRY_MAX_DELAY)
+
+
+# This class listens to the server's /stream route in a background thread and sends every counter change to the GUI.
+# It runs as a daemon thread so it never keeps the app open, and it reconnects on its own if the server goes away.
+class CounterStreamListener:
+    def __init__(self, serverUrl):
+        self.serverUrl = serverUrl
+        self.signals = StreamSignals()
+        self.keepRunning = True
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+
+    def Start(self):
+        self.thread.start()
+
+    def Stop(self):
+        self.keepRunning = False
+
+    # this function keeps a connection to /stream open and reads the events as they arrive.
+    def Run(self):
+        while self.keepRunning:
+            try:
+                with requests.get(f"{self.serverUrl}/stream", stream=True, timeout=(3, STREAM_READ_TIMEOUT)) as response:
+                    if response.status_code == 200:
+                        self.signals.connectionChanged.emit(True)
+                        # reads one byte at a time so each tiny event is handed over as soon as it arrives.
+                        for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+                            if not self.keepRunning:
+                                return
+                            if line and line.startswith('data:'):
+                                data = json.loads(line[len('data:'):])
+                                self.signals.counterChanged.emit(data.get('counter'))
+            except Exception:
+                pass
+
+            self.signals.connectionChanged.emit(False)
+            time.sleep(STREAM_RECONNECT_SECONDS)
 
 
 # This class handles the main window for the ClientApp.
@@ -11,7 +182,21 @@ class ClientApp(QMainWindow):
         super().__init__()  # Initializes the QMainWindow parent class.
         uic.loadUi('Client.ui', self)  # Loads the UI file created in Qt Designer.
 
-        self.serverUrl = 'http://10.0.2.15:5000'  # The URL where the presenter's server is running.
+        self.serverUrl = os.environ.get('SANE_SERVER_URL', 'http://10.0.2.15:5000')  # The URL where the presenter's server is running.
+        roomId = os.environ.get('SANE_ROOM')  # set this when the server hosts several presentations at once.
+        if roomId:
+            self.serverUrl = f"{self.serverUrl}/rooms/{roomId}"  # every route (/increment, /query, /stream) then goes to that room.
+
+        # This section starts the background worker that reads the counter from the server.
+        self.transport = CounterTransport(self.serverUrl)
+        self.transport.signals.counterReceived.connect(self.UpdateCounterLabel)
+        self.transport.Start()
+
+        # This section starts the outbox that merges the button presses and makes sure each one reaches the server once.
+        self.outbox = CounterOutbox(self.serverUrl)
+        self.outbox.signals.counterReceived.connect(self.UpdateCounterLabel)
+        self.outbox.signals.requestFailed.connect(self.OnRequestFailed)
+        self.outbox.Start()
 
         # Connects the buttons on the UI to their respective functions.
         self.IncrementButton.clicked.connect(self.IncrementCounter)
@@ -21,53 +206,59 @@ class ClientApp(QMainWindow):
         # This section sets up a timer that runs in the background.
         # It calls the QueryCounter function every 500ms (0.5 seconds).
         # This keeps the client updated if the server resets the counter (like when a new presentation starts).
+        # It is only a fallback, once the /stream connection is up the timer is stopped.
         self.pollTimer = QTimer()
         self.pollTimer.timeout.connect(self.QueryCounter)
         self.pollTimer.start(500)
 
+        # This section subscribes to the server's /stream route so counter changes get pushed to us.
+        self.streamListener = CounterStreamListener(self.serverUrl)
+        self.streamListener.signals.counterChanged.connect(self.UpdateCounterLabel)
+        self.streamListener.signals.connectionChanged.connect(self.OnStreamConnectionChanged)
+        self.streamListener.Start()
+
         # Calls this once at startup to get the initial count immediately.
         self.QueryCounter()
 
     # This function is called when the "Increment" button is clicked.
-    # It sends a request to the server to add 1 to the counter.
+    # It adds 1 to the outbox, which sends it to the server, the answer comes back through UpdateCounterLabel.
     def IncrementCounter(self):
-        try:
-            # Sends a POST request to the /increment route on the server.
-            response = requests.post(f"{self.serverUrl}/increment")
-
-            # checks if the server responds with "OK" (200), we update our label with the new count.
-            if response.status_code == 200:
-                data = response.json()  # Converts the JSON response to a dictionary.
-                self.CounterLabel.setText(f"Counter: {data.get('counter')}")
-        except Exception as e:
-            # checks if something goes wrong
-            print(f"Post Error: {e}")
+        self.outbox.Add(1)
 
     # This function is called when the "Decrement" button is clicked.
-    # It works just like Increment, but calls the /decrement route instead.
+    # It works just like Increment, but takes 1 away instead.
     def DecrementCounter(self):
-        try:
-            response = requests.post(f"{self.serverUrl}/decrement")
-            if response.status_code == 200:
-                data = response.json()
-                self.CounterLabel.setText(f"Counter: {data.get('counter')}")
-        except Exception as e:
-            print(f"Post Error: {e}")
+        self.outbox.Add(-1)
 
     # This function is called automatically by the timer every 0.5 seconds.
     # gets the current ah counter from the server.
     def QueryCounter(self):
-        try:
-            # Sends a GET request to the /query route.
-            response = requests.get(f"{self.serverUrl}/query")
+        self.transport.Query()
+
+    @pyqtSlot(str)
+    # this function prints the error when a request to the server fails.
+    def OnRequestFailed(self, message):
+        print(message)
+
+    @pyqtSlot(int)
+    # this function updates the label when the stream or a request brings back a new counter value.
+    def UpdateCounterLabel(self, newValue):
+        self.CounterLabel.setText(f"Counter: {newValue}")
 
-            if response.status_code == 200:
-                data = response.json()
-                # Updates the label with the current count from the server.
-                self.CounterLabel.setText(f"Counter: {data.get('counter')}")
-        except Exception as e:
+    @pyqtSlot(bool)
+    # this function turns polling off while the stream is connected and back on as a fallback when it drops.
+    def OnStreamConnectionChanged(self, isConnected):
+        if isConnected:
+            self.pollTimer.stop()
+        elif not self.pollTimer.isActive():
+            self.pollTimer.start(500)
 
-            pass
+    # this function stops the stream listener and the request workers when the window closes.
+    def closeEvent(self, event):
+        self.streamListener.Stop()
+        self.transport.Stop()
+        self.outbox.Stop()
+        event.accept()
 
 
 # This runs when you execute the script.
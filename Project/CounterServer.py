@@ -0,0 +1,631 @@
+import os
+import io
+import re
+import json
+import time
+import socket
+import selectors
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from flask import Flask, jsonify, request, Response, g
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from SessionLog import SessionLogger, EVENT_INCREMENT, EVENT_DECREMENT
+
+# This module is the counter API on its own: the counters, the rooms, the /stream hub, the latency metrics and the
+# WSGI server. It needs neither Qt nor OpenCV, so the headless server and the load test can run without them.
+# ServerMain imports it and adds the window on top.
+
+# CONSTANTS
+# these settings control how the counter API is served. they can be changed with environment variables without editing the code.
+SERVER_HOST = os.environ.get('SANE_SERVER_HOST', '10.0.2.15')
+SERVER_PORT = int(os.environ.get('SANE_SERVER_PORT', '5000'))
+SERVER_BACKEND = os.environ.get('SANE_SERVER_BACKEND', 'threaded')  # 'threaded', 'waitress' or 'werkzeug' (the old dev server).
+SERVER_WORKERS = int(os.environ.get('SANE_SERVER_WORKERS', '128'))  # every open keep-alive connection holds one worker (open /stream connections don't on this server).
+SERVER_BACKLOG = int(os.environ.get('SANE_SERVER_BACKLOG', '256'))  # how many connections can wait to be accepted before new ones are refused.
+KEEPALIVE_TIMEOUT = 5  # seconds an idle keep-alive connection is held open before its worker is freed.
+# waitress watches idle connections from its event loop, so they don't hold one of its threads and can stay open longer.
+# this is waitress's own default, and it has to stay above STREAM_KEEPALIVE_SECONDS or open /streams get cut.
+WAITRESS_CHANNEL_TIMEOUT = 120
+WORKER_WAIT_SECONDS = 1  # how long a new connection may wait for a free worker before it gets a 503.
+BUSY_BODY = json.dumps({'success': False, 'error': "server busy, try again"}).encode()
+BUSY_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\nRetry-After: 1\r\n"
+                 b"Connection: close\r\nContent-Length: " + str(len(BUSY_BODY)).encode() + b"\r\n\r\n" + BUSY_BODY)
+
+STREAM_KEEPALIVE_SECONDS = 15  # how often an idle /stream sends a comment line so dead clients get noticed.
+STREAM_RESPONSE_HEADERS = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                           b"X-Accel-Buffering: no\r\nConnection: close\r\n\r\n")  # the body runs until the connection closes.
+MAX_BATCH_SIZE = 100  # the largest n accepted by /increment?n= and /decrement?n=.
+MAX_DELTA = 1000  # the largest change (either way) accepted by /delta, clients can build these up while offline.
+IDEMPOTENCY_KEYS_KEPT = 4096  # how many recent /delta keys each counter remembers so a retried delta isn't applied twice.
+ROOM_IDLE_SECONDS = 30 * 60  # rooms nobody has used for this long (and with no open streams) are removed.
+ROOM_SWEEP_INTERVAL = 60  # seconds between checks for idle rooms.
+MAX_ROOMS = 500  # the most rooms one server will hold at once.
+ROOM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')  # room ids are short names like "room12" or "team-blue".
+METRICS_WINDOW = 500  # how many recent timings per stage the p50/p95/p99 numbers are worked out from.
+flaskApp = Flask(__name__)  # intializes Flask
+
+
+# This class stores the "Uh counter". Every change happens under one lock, so increments coming from different server threads
+# are never lost and a reset from the GUI can't land in the middle of one. It also remembers whether the GUI has seen the
+# latest value, so the GUI is only told once no matter how many requests come in before it gets around to repainting.
+class CounterStore:
+    def __init__(self):
+        self.condition = threading.Condition()  # the /stream route waits on this until the counter changes.
+        self.value = 0
+        self.version = 0  # goes up on every change.
+        self.pendingIncrements = 0  # increments the GUI hasn't flashed for yet.
+        self.uiDirty = False
+        self.onDirty = None  # called (outside the lock) when the store goes from seen to not-seen-by-the-GUI.
+        self.lastActivity = time.monotonic()  # used by RoomRegistry to find idle rooms.
+        self.subscribers = 0  # how many /stream connections are open on this counter.
+        self.onChange = None  # called (with the lock held, so it has to be quick) on every change, set by the stream hub.
+        self.appliedKeys = OrderedDict()  # the most recent /delta idempotency keys, oldest first.
+
+    # this function adds delta to the counter and returns the new value.
+    def Add(self, delta):
+        with self.condition:
+            self.value += delta
+            if delta > 0:
+                self.pendingIncrements += delta
+            value = self.value
+            notifyUi = self.MarkChanged()
+        if notifyUi and self.onDirty:
+            self.onDirty()
+        return value
+
+    # this function adds delta only if no delta with this key was applied before. it returns (new value, whether it was applied).
+    def AddOnce(self, key, delta):
+        with self.condition:
+            if key in self.appliedKeys:
+                self.appliedKeys.move_to_end(key)
+                return self.value, False
+            self.appliedKeys[key] = True  # the key is remembered first, so a retry arriving at the same time is turned away.
+            if len(self.appliedKeys) > IDEMPOTENCY_KEYS_KEPT:
+                self.appliedKeys.popitem(last=False)
+        return self.Add(delta), True
+
+    # this function sets the counter back to a value (0 when a new presentation starts) without flashing.
+    def Reset(self, value=0):
+        with self.condition:
+            self.value = value
+            self.pendingIncrements = 0
+            notifyUi = self.MarkChanged()
+        if notifyUi and self.onDirty:
+            self.onDirty()
+
+    # this function must be called with the lock held. it wakes the streams and returns True if the GUI needs to be told.
+    def MarkChanged(self):
+        self.version += 1
+        self.condition.notify_all()
+        if self.onChange:
+            self.onChange(self)
+        notifyUi = not self.uiDirty
+        self.uiDirty = True
+        return notifyUi
+
+    # this function returns the current counter value.
+    def Get(self):
+        with self.condition:
+            return self.value
+
+    # this function returns (version, value) right now.
+    def Snapshot(self):
+        with self.condition:
+            return self.version, self.value
+
+    # this function waits until the version is different from lastVersion (or the timeout runs out) and returns (version, value).
+    def WaitForChange(self, lastVersion, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != lastVersion, timeout=timeout)
+            return self.version, self.value
+
+    # this function adds (1) or removes (-1) an open /stream connection.
+    def ChangeSubscribers(self, delta):
+        with self.condition:
+            self.subscribers += delta
+
+    # this function is called by the GUI when it repaints. it returns the value and how many increments happened since last time.
+    def TakeUiUpdate(self):
+        with self.condition:
+            self.uiDirty = False
+            increments = self.pendingIncrements
+            self.pendingIncrements = 0
+            return self.value, increments
+
+
+counterStore = CounterStore()  # this is where the "Uh counter" is stored
+
+
+# This class keeps one CounterStore per room so one server can host many presentations at once (/rooms/<id>/...).
+# Rooms are made the first time they are used. Rooms that nobody has touched for ROOM_IDLE_SECONDS and that have no open
+# streams are removed, which is checked at most every ROOM_SWEEP_INTERVAL seconds so it costs nothing per request.
+# The presenter's own counter is the "default" room and is never removed.
+class RoomRegistry:
+    def __init__(self, defaultStore):
+        self.lock = threading.Lock()
+        self.defaultStore = defaultStore
+        self.rooms = {'default': defaultStore}
+        self.lastSweep = time.monotonic()
+
+    # this function returns the room's counter, making it if needed. it returns None if the server already has MAX_ROOMS rooms.
+    def GetRoom(self, roomId):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.lastSweep >= ROOM_SWEEP_INTERVAL:
+                self.EvictIdleRooms(now)
+
+            store = self.rooms.get(roomId)
+            if store is None:
+                if len(self.rooms) >= MAX_ROOMS:
+                    return None
+                store = CounterStore()
+                self.rooms[roomId] = store
+            store.lastActivity = now
+            return store
+
+    # this function removes the idle rooms. it must be called with the lock held.
+    def EvictIdleRooms(self, now):
+        for roomId, store in list(self.rooms.items()):
+            if store is not self.defaultStore and store.subscribers == 0 and now - store.lastActivity >= ROOM_IDLE_SECONDS:
+                del self.rooms[roomId]
+        self.lastSweep = now
+
+    # this function returns how many rooms exist right now.
+    def Count(self):
+        with self.lock:
+            return len(self.rooms)
+
+
+rooms = RoomRegistry(counterStore)  # every room's counter, the presenter's counter is the "default" room.
+
+
+# This class serves every /stream connection from one thread, so an open stream costs a socket instead of a server worker.
+# The request handler sends the response headers and hands the socket over with Add. After that the hub writes an event
+# to a counter's subscribers whenever that counter changes, and a keep-alive comment to everyone every
+# STREAM_KEEPALIVE_SECONDS. A client that closes its end, or whose socket buffer is full (it stopped reading), is dropped,
+# the client falls back to polling and reconnects on its own.
+class StreamHub:
+    def __init__(self):
+        self.lock = threading.Lock()  # guards newSubscribers and changedStores, everything else is only used by the hub thread.
+        self.newSubscribers = []  # (socket, store) pairs handed over since the hub last woke up.
+        self.changedStores = set()  # counters that changed since the hub last woke up.
+        self.selector = selectors.DefaultSelector()
+        self.storeSockets = {}  # store -> set of its subscriber sockets.
+        self.socketStores = {}  # socket -> the store it follows.
+        self.sentVersions = {}  # socket -> the counter version it was last sent.
+        self.wakeReader, self.wakeWriter = socket.socketpair()
+        self.wakeReader.setblocking(False)
+        self.wakeWriter.setblocking(False)
+        self.selector.register(self.wakeReader, selectors.EVENT_READ)
+        self.thread = None
+
+    # this function hands a stream socket (with the headers already sent) to the hub. the current value is sent right away.
+    def Add(self, sock, store):
+        store.ChangeSubscribers(1)
+        store.onChange = self.Notify
+        with self.lock:
+            self.newSubscribers.append((sock, store))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.Run, daemon=True, name='stream-hub')
+                self.thread.start()
+        self.Wake()
+
+    # this function is called by a counter whenever it changes. it only notes the change, the hub thread sends it.
+    def Notify(self, store):
+        with self.lock:
+            self.changedStores.add(store)
+        self.Wake()
+
+    def Wake(self):
+        try:
+            self.wakeWriter.send(b'x')
+        except OSError:
+            pass  # the wake-up pipe is already full, so the hub is going to wake anyway.
+
+    # this function is the hub thread. it waits for changes, closed sockets or the next keep-alive, whichever comes first.
+    def Run(self):
+        nextKeepAlive = time.monotonic() + STREAM_KEEPALIVE_SECONDS
+        while True:
+            for key, _ in self.selector.select(max(0.0, nextKeepAlive - time.monotonic())):
+                if key.fileobj is self.wakeReader:
+                    try:
+                        while self.wakeReader.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                else:
+                    self.ReadClient(key.fileobj)
+
+            with self.lock:
+                newSubscribers, self.newSubscribers = self.newSubscribers, []
+                changedStores, self.changedStores = self.changedStores, set()
+            for sock, store in newSubscribers:
+                sock.setblocking(False)
+                self.selector.register(sock, selectors.EVENT_READ)
+                self.socketStores[sock] = store
+                self.sentVersions[sock] = -1
+                self.storeSockets.setdefault(store, set()).add(sock)
+                changedStores.add(store)  # so the new subscriber gets the current value.
+
+            for store in changedStores:
+                version, counter = store.Snapshot()
+                message = f"data: {json.dumps({'counter': counter})}\n\n".encode()
+                for sock in list(self.storeSockets.get(store, ())):
+                    if self.sentVersions[sock] != version:
+                        self.sentVersions[sock] = version
+                        self.Send(sock, message)
+
+            if time.monotonic() >= nextKeepAlive:
+                for sock in list(self.socketStores):
+                    self.Send(sock, b": keep-alive\n\n")
+                nextKeepAlive = time.monotonic() + STREAM_KEEPALIVE_SECONDS
+
+    # this function handles a readable stream socket. clients never send anything, so this means it closed (or broke).
+    def ReadClient(self, sock):
+        try:
+            if sock.recv(4096):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self.Drop(sock)
+
+    # this function writes one event without ever waiting. a client that can't take a few bytes has stopped reading.
+    def Send(self, sock, data):
+        try:
+            if sock.send(data) == len(data):
+                return
+        except OSError:
+            pass
+        self.Drop(sock)
+
+    def Drop(self, sock):
+        store = self.socketStores.pop(sock, None)
+        if store is None:
+            return
+        del self.sentVersions[sock]
+        self.storeSockets[store].discard(sock)
+        if not self.storeSockets[store]:
+            del self.storeSockets[store]
+        self.selector.unregister(sock)
+        store.ChangeSubscribers(-1)
+        sock.close()
+
+
+streamHub = StreamHub()  # serves every open /stream connection on the threaded server.
+
+
+# This class keeps the most recent timings of every stage (capture, convert, scale, detect_emotions and each HTTP route)
+# so we can tell where the time goes. Only the last METRICS_WINDOW samples are kept per stage, so the percentiles are rolling.
+class LatencyMetrics:
+    def __init__(self, windowSize=METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.windowSize = windowSize
+        self.samples = {}  # stage name -> deque of the latest timings in seconds.
+        self.totals = {}  # stage name -> [count, sum of seconds] since startup.
+
+    # this function records how long one run of a stage took.
+    def Record(self, stage, seconds):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.windowSize)
+                self.totals[stage] = [0, 0.0]
+            self.samples[stage].append(seconds)
+            self.totals[stage][0] += 1
+            self.totals[stage][1] += seconds
+
+    # this function times the code inside a with block and records it under the stage name.
+    @contextmanager
+    def Time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.Record(stage, time.perf_counter() - start)
+
+    # this function returns {stage: (count, sum, p50, p95, p99)} with the percentiles in seconds.
+    def Snapshot(self):
+        with self.lock:
+            copied = {stage: (list(samples), self.totals[stage]) for stage, samples in self.samples.items()}
+
+        snapshot = {}
+        for stage, (samples, (count, total)) in sorted(copied.items()):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            snapshot[stage] = (count, total, p50, p95, p99)
+        return snapshot
+
+    # this function formats the snapshot in the Prometheus text format for the /metrics route.
+    def ToPrometheus(self):
+        lines = [
+            "# HELP sane_stage_latency_seconds Rolling latency of each pipeline stage and HTTP route.",
+            "# TYPE sane_stage_latency_seconds summary",
+        ]
+        for stage, (count, total, p50, p95, p99) in self.Snapshot().items():
+            for quantile, value in (('0.5', p50), ('0.95', p95), ('0.99', p99)):
+                lines.append(f'sane_stage_latency_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'sane_stage_latency_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'sane_stage_latency_seconds_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    # this function formats the snapshot as a few short lines of text for the overlay in the server window.
+    def ToOverlayText(self):
+        lines = ["stage            p50     p95     p99 (ms)"]
+        for stage, (count, total, p50, p95, p99) in self.Snapshot().items():
+            lines.append(f"{stage:<14} {p50 * 1000:6.1f}  {p95 * 1000:6.1f}  {p99 * 1000:6.1f}")
+        return "\n".join(lines)
+
+
+metrics = LatencyMetrics()  # this is where every stage's timings are collected.
+sessionLog = SessionLogger()  # records every counter change and emotion sample while a presentation is running.
+
+
+# this function reads the optional n from the query string (like /increment?n=3). it returns None if n isn't valid.
+def ParseBatchSize():
+    try:
+        n = int(request.args.get('n', '1'))
+    except ValueError:
+        return None  # things like n=abc or n=2.5 are rejected instead of quietly counting as 1.
+    if n < 1 or n > MAX_BATCH_SIZE:
+        return None
+    return n
+
+
+# these two hooks time every HTTP request so each route's latency shows up in the metrics.
+@flaskApp.before_request
+def StartRequestTimer():
+    g.requestStart = time.perf_counter()
+
+
+@flaskApp.after_request
+def RecordRequestTime(response):
+    if 'requestStart' in g:
+        route = request.url_rule.rule if request.url_rule else 'unknown'
+        metrics.Record(f"http {route}", time.perf_counter() - g.requestStart)
+    return response
+
+
+# links function to the /metrics route. it returns the rolling p50/p95/p99 of every stage in the Prometheus text format.
+@flaskApp.route('/metrics', methods=['GET'])
+def Metrics():
+    gauge = f"# HELP sane_uh_counter Current value of the uh counter.\n# TYPE sane_uh_counter gauge\nsane_uh_counter {counterStore.Get()}\n"
+    gauge += f"# HELP sane_rooms Number of rooms on this server.\n# TYPE sane_rooms gauge\nsane_rooms {rooms.Count()}\n"
+    return Response(metrics.ToPrometheus() + gauge, mimetype='text/plain; version=0.0.4')
+
+
+# this function applies an increment (sign 1) or decrement (sign -1) of n to a counter and returns the JSON response.
+# only the presenter's own counter is written to the session log.
+def ChangeCounter(store, sign):
+    n = ParseBatchSize()
+    if n is None:
+        return jsonify({'success': False, 'error': f"n must be between 1 and {MAX_BATCH_SIZE}"}), 400
+    if store is counterStore:
+        sessionLog.Log(EVENT_INCREMENT if sign > 0 else EVENT_DECREMENT, n)
+    return jsonify({'success': True, 'counter': store.Add(sign * n)})
+
+
+# this function applies a client's merged delta from a JSON body like {"delta": 3, "key": "..."} exactly once.
+# clients retry with the same key until they get an answer, and a key that was seen before is not applied again.
+def ApplyCounterDelta(store):
+    data = request.get_json(silent=True) or {}
+    delta = data.get('delta')
+    key = data.get('key')
+    if type(delta) is not int or delta == 0 or abs(delta) > MAX_DELTA:
+        return jsonify({'success': False, 'error': f"delta must be a non-zero integer up to {MAX_DELTA}"}), 400
+    if not isinstance(key, str) or not 0 < len(key) <= 64:
+        return jsonify({'success': False, 'error': "key must be a string of 1 to 64 characters"}), 400
+
+    value, applied = store.AddOnce(key, delta)
+    if applied and store is counterStore:
+        sessionLog.Log(EVENT_INCREMENT if delta > 0 else EVENT_DECREMENT, abs(delta))
+    return jsonify({'success': True, 'counter': value, 'applied': applied})
+
+
+# this function returns a Server-Sent Events response that pushes the counter every time it changes.
+# on the threaded server the connection is handed to the stream hub, so it doesn't hold a worker. the other backends
+# can't give the socket away, so there the stream runs on the worker: an idle stream just sleeps on the condition
+# and sends a keep-alive comment now and then.
+def StreamCounter(store):
+    detachStream = request.environ.get('sane.detach_stream')
+    if detachStream is not None:
+        sock = detachStream()
+        try:
+            sock.sendall(STREAM_RESPONSE_HEADERS)
+        except OSError:
+            sock.close()
+        else:
+            streamHub.Add(sock, store)
+        return Response(status=200)  # the request handler throws this away, the hub has already answered.
+
+    def EventStream():
+        store.ChangeSubscribers(1)
+        try:
+            lastVersion = -1
+            while True:
+                version, counter = store.WaitForChange(lastVersion, STREAM_KEEPALIVE_SECONDS)
+                if version != lastVersion:
+                    lastVersion = version
+                    yield f"data: {json.dumps({'counter': counter})}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            store.ChangeSubscribers(-1)  # runs when the client disconnects.
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(EventStream(), mimetype='text/event-stream', headers=headers)
+
+
+# this function looks up a room for the /rooms routes. it returns (store, None) or (None, error response).
+def LookupRoom(roomId):
+    if not ROOM_ID_PATTERN.match(roomId):
+        return None, (jsonify({'success': False, 'error': "invalid room id"}), 400)
+    store = rooms.GetRoom(roomId)
+    if store is None:
+        return None, (jsonify({'success': False, 'error': "server has no free rooms"}), 503)
+    return store, None
+
+
+# Links function to a flask route. whenever /query is accessed, the function returns the current "ah counter"
+@flaskApp.route('/query', methods=['GET'])
+def Query():
+    return jsonify({'counter': counterStore.Get()})
+
+
+# links function to this flask route. whenever /incrmenet ic accessed, the function incrmeents the counter by 1 (or by n for /increment?n=k).
+@flaskApp.route('/increment', methods=['POST'])
+def IncrementCounter():
+    return ChangeCounter(counterStore, 1)
+
+
+# links function to flask route. this section calls function whenever the /decrement is accessed and decrements the counter by 1 (or by n).
+@flaskApp.route('/decrement', methods=['POST'])
+def DecrementCounter():
+    return ChangeCounter(counterStore, -1)
+
+
+# links function to the /delta route. clients send their merged button presses here (see ApplyCounterDelta).
+@flaskApp.route('/delta', methods=['POST'])
+def ApplyDelta():
+    return ApplyCounterDelta(counterStore)
+
+
+# links function to the /stream route. this keeps the connection open and pushes the counter as Server-Sent Events every time it changes,
+# so clients don't have to keep polling /query.
+@flaskApp.route('/stream', methods=['GET'])
+def Stream():
+    return StreamCounter(counterStore)
+
+
+# links functions to the /rooms/<id>/... routes. they work just like /query, /increment, /decrement, /delta and /stream,
+# but on that room's own counter, so several presentations can share one server.
+@flaskApp.route('/rooms/<roomId>/query', methods=['GET'])
+def RoomQuery(roomId):
+    store, error = LookupRoom(roomId)
+    return error or jsonify({'counter': store.Get()})
+
+
+@flaskApp.route('/rooms/<roomId>/increment', methods=['POST'])
+def RoomIncrement(roomId):
+    store, error = LookupRoom(roomId)
+    return error or ChangeCounter(store, 1)
+
+
+@flaskApp.route('/rooms/<roomId>/decrement', methods=['POST'])
+def RoomDecrement(roomId):
+    store, error = LookupRoom(roomId)
+    return error or ChangeCounter(store, -1)
+
+
+@flaskApp.route('/rooms/<roomId>/delta', methods=['POST'])
+def RoomDelta(roomId):
+    store, error = LookupRoom(roomId)
+    return error or ApplyCounterDelta(store)
+
+
+@flaskApp.route('/rooms/<roomId>/stream', methods=['GET'])
+def RoomStream(roomId):
+    store, error = LookupRoom(roomId)
+    return error or StreamCounter(store)
+
+
+# This class handles one client connection. it speaks HTTP/1.1 so clients can keep the connection open between requests,
+# and drops the connection after it has been idle for KEEPALIVE_TIMEOUT seconds.
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+
+    # this lets StreamCounter take the connection over (see DetachStream).
+    def make_environ(self):
+        environ = super().make_environ()
+        environ['sane.detach_stream'] = self.DetachStream
+        return environ
+
+    # this function gives the connection's socket away to the stream hub. whatever the app still writes for this
+    # request goes nowhere, the handler stops after it, and the server doesn't close the socket when it is done.
+    def DetachStream(self):
+        self.wfile = io.BytesIO()
+        self.close_connection = True
+        self.server.detachedSockets.add(self.connection)
+        return self.connection
+
+    # this stops every single request from being printed to the console, which gets slow under load.
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+# This class is a multi-threaded WSGI server that serves at most `workers` connections at once, each on its own thread.
+# The threads are daemon threads, so a connection that never ends can't keep the app from closing. The accept loop never
+# waits: a new connection waits on its own thread for up to WORKER_WAIT_SECONDS for a free worker (so a short burst is
+# still served) and then gets a 503, and once `backlog` connections are already waiting the next one gets a 503 right away.
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, workers, backlog):
+        self.request_queue_size = backlog  # has to be set before the socket starts listening.
+        super().__init__(host, port, app, handler=KeepAliveRequestHandler)
+        self.workerSlots = threading.BoundedSemaphore(workers)
+        self.waitingSlots = threading.BoundedSemaphore(backlog)  # connections allowed to wait for a worker.
+        self.detachedSockets = set()  # connections handed to the stream hub, which closes them itself.
+
+    # this function hands an accepted connection to a thread of its own, or turns it away if too many are already waiting.
+    def process_request(self, request, client_address):
+        if not self.waitingSlots.acquire(blocking=False):
+            self.RejectBusy(request)
+            return
+        threading.Thread(target=self.ProcessRequestWorker, args=(request, client_address), daemon=True).start()
+
+    # this function answers a connection with a 503 without handing it to a worker.
+    def RejectBusy(self, request):
+        try:
+            request.settimeout(0.05)
+            request.recv(65536)  # reads the request first, closing with it unread would reset the connection before the 503 arrives.
+            request.sendall(BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    # this function runs on a worker thread and serves every request sent over the connection.
+    def ProcessRequestWorker(self, request, client_address):
+        gotWorker = self.workerSlots.acquire(timeout=WORKER_WAIT_SECONDS)
+        self.waitingSlots.release()
+        if not gotWorker:
+            self.RejectBusy(request)
+            return
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            if request in self.detachedSockets:
+                self.detachedSockets.discard(request)  # the stream hub owns this connection now.
+            else:
+                self.shutdown_request(request)
+            self.workerSlots.release()
+
+
+# this function starts serving the counter API with the chosen backend. it blocks until the server stops.
+def RunCounterServer(backend=SERVER_BACKEND, host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, backlog=SERVER_BACKLOG):
+    if backend == 'waitress':
+        try:
+            import waitress  # optional dependency, only needed for this backend.
+        except ImportError:
+            print("waitress is not installed, falling back to the threaded server.")
+            backend = 'threaded'
+        else:
+            waitress.serve(flaskApp, host=host, port=port, threads=workers, backlog=backlog, channel_timeout=WAITRESS_CHANNEL_TIMEOUT)
+            return
+
+    if backend == 'werkzeug':
+        flaskApp.run(host=host, port=port, debug=False)
+        return
+
+    server = PooledWSGIServer(host, port, flaskApp, workers, backlog)
+    print(f"Serving counter API on http://{host}:{port} with {workers} workers")
+    server.serve_forever()
+
+
+# This runs when you execute the script, it serves only the counter API (like python ServerMain.py --headless).
+if __name__ == '__main__':
+    RunCounterServer()
@@ -0,0 +1,159 @@
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+RING_SLOTS = 4  # how many frames the shared ring holds, readers have this many frames of time to copy one out.
+
+
+# this function attaches to a shared memory block made by another process. on Python 3.13+ track=False keeps the
+# resource tracker out of it, the process that made the block is the one that unlinks it. older versions have no way to
+# opt out: there the block is just attached. all the pipeline processes share one tracker, which already knows the name
+# from the process that made the block, and unregistering it here would take it away from that process.
+def AttachSharedMemory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# This class is a ring of frame slots in one shared memory block, so frames can go between processes without pickling.
+# The capture process writes frame number seq into slot seq % RING_SLOTS, and every slot has a sequence number that is
+# set to -1 while the slot is being written. A reader copies a slot out and checks the sequence number before and after,
+# so a frame that got overwritten while it was being copied is noticed and thrown away.
+class SharedFrameRing:
+    def __init__(self, shape, name=None, create=False, slots=RING_SLOTS):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frameBytes = int(np.prod(self.shape))
+        headerBytes = slots * 16  # one int64 sequence number and one float64 timestamp per slot.
+
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=headerBytes + slots * frameBytes)
+        else:
+            self.shm = AttachSharedMemory(name)
+        self.name = self.shm.name
+
+        self.sequences = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.timestamps = np.ndarray((slots,), dtype=np.float64, buffer=self.shm.buf, offset=slots * 8)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=headerBytes)
+        if create:
+            self.sequences[:] = -1
+
+    # this function marks the slot for frame seq as being written and returns the array to write the frame into.
+    def BeginWrite(self, seq):
+        slot = seq % self.slots
+        self.sequences[slot] = -1
+        return self.frames[slot]
+
+    # this function marks frame seq as complete so readers can use it.
+    def EndWrite(self, seq, timestamp):
+        slot = seq % self.slots
+        self.timestamps[slot] = timestamp
+        self.sequences[slot] = seq
+
+    # this function copies frame seq into out. it returns its capture timestamp, or None if the frame was already overwritten.
+    def Read(self, seq, out):
+        slot = seq % self.slots
+        if self.sequences[slot] != seq:
+            return None
+        timestamp = self.timestamps[slot]
+        np.copyto(out, self.frames[slot])
+        if self.sequences[slot] != seq:
+            return None
+        return timestamp
+
+    # this function lets go of the shared memory in this process. the numpy views have to go first.
+    def Close(self):
+        del self.sequences, self.timestamps, self.frames
+        self.shm.close()
+
+    # this function deletes the shared memory block, only the process that made it should call this.
+    def Unlink(self):
+        self.shm.unlink()
+
+
+# this function is the main loop of the capture process. it reads frames straight into the shared ring and tells the GUI
+# process about each new one. infoQueue gets (ring name, frame shape) once the first frame is in, or None if the source
+# could not be opened.
+def CaptureProcessMain(captureSource, infoQueue, latestSeq, newFrameEvent, stopEvent):
+    cap = captureSource.Open()
+    ret, firstFrame = cap.read() if cap is not None else (False, None)
+    if not ret:
+        infoQueue.put(None)
+        if cap is not None:
+            cap.release()
+        return
+
+    ring = SharedFrameRing(firstFrame.shape, create=True)
+    infoQueue.put((ring.name, firstFrame.shape))
+    playbackFps = captureSource.PlaybackFps(cap)
+    playbackInterval = 1 / playbackFps if playbackFps > 0 else 0
+    nextReadTime = 0.0
+
+    seq = 0
+    try:
+        while not stopEvent.is_set():
+            if playbackInterval > 0:  # plays video files back at their own speed.
+                delay = nextReadTime - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                nextReadTime = max(nextReadTime + playbackInterval, time.monotonic())
+
+            slotFrame = ring.BeginWrite(seq)
+            ret, frame = cap.read(slotFrame)
+            if not ret:
+                if playbackInterval > 0:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # the video file ended, start it over.
+                time.sleep(0.01)
+                continue
+            if frame is not slotFrame:
+                if frame.shape != ring.shape:
+                    continue  # the source changed resolution, which the ring can't hold.
+                np.copyto(slotFrame, frame)
+
+            ring.EndWrite(seq, time.monotonic())
+            latestSeq.value = seq
+            newFrameEvent.set()
+            seq += 1
+    finally:
+        cap.release()
+        ring.Close()
+        ring.Unlink()
+
+
+# this function is the main loop of one inference process. it loads its own detector, then takes frame numbers from
+# taskQueue, copies those frames out of the shared ring and puts the results on resultQueue.
+# messages sent back are ('ready', worked) once, then ('result', seq, result, cost) or ('dropped', seq) for every task.
+def InferenceProcessMain(createDetector, ringName, shape, taskQueue, resultQueue):
+    ring = SharedFrameRing(shape, name=ringName)
+    try:
+        detector = createDetector()
+        detector.WarmUp()
+    except Exception as e:
+        print(f"Could not load the emotion model: {e}")
+        resultQueue.put(('ready', False))
+        ring.Close()
+        return
+    resultQueue.put(('ready', True))
+
+    frame = np.empty(ring.shape, dtype=np.uint8)
+    try:
+        while True:
+            seq = taskQueue.get()
+            if seq is None:
+                break
+            if ring.Read(seq, frame) is None:
+                resultQueue.put(('dropped', seq))  # the frame was overwritten before this worker got to it.
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = detector.Analyze([frame])
+            except Exception as e:
+                print(f"Inference Error: {e}")
+                resultQueue.put(('dropped', seq))
+                continue
+            resultQueue.put(('result', seq, result, time.perf_counter() - start))
+    finally:
+        ring.Close()
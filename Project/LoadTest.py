@@ -0,0 +1,268 @@
+import sys
+import json
+import time
+import uuid
+import socket
+import random
+import argparse
+import threading
+import http.client
+import tracemalloc
+
+
+# this function works out a percentile from a list of latencies that is already sorted.
+def Percentile(sortedValues, percent):
+    if not sortedValues:
+        return 0.0
+    index = round(percent / 100 * (len(sortedValues) - 1))
+    return sortedValues[index]
+
+
+# this function acts like one client. it sends requests over a single keep-alive connection and records how long each one took.
+def RunClient(host, port, method, route, count, latencies, errors):
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            connection.request(method, route)
+            response = connection.getresponse()
+            response.read()  # the body has to be read before the connection can be reused.
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status)
+        except Exception as e:
+            # opens a fresh connection if this one broke so the next request still gets sent.
+            errors.append(str(e))
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+    connection.close()
+
+
+# this function runs every client at the same time against one route and returns the throughput and latency numbers.
+# if rooms is more than 0, the route should contain {room} and the clients are spread evenly over that many rooms.
+def RunBenchmark(host, port, method, route, clients, requestsPerClient, rooms=0):
+    latencies = []
+    errors = []
+    threads = []
+    for i in range(clients):
+        clientRoute = route.format(room=f"room{i % rooms}") if rooms > 0 else route
+        threads.append(threading.Thread(target=RunClient, args=(host, port, method, clientRoute, requestsPerClient, latencies, errors)))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'route': route,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50': Percentile(latencies, 50),
+        'p99': Percentile(latencies, 99),
+    }
+
+
+# this function opens perRoom /stream connections on every room (or on the presenter's counter if rooms is 0) and keeps
+# them open, like the ClientApps in a room would. it returns the sockets of the streams the server accepted.
+def OpenStreams(host, port, rooms, perRoom):
+    routes = [f"/rooms/room{i}/stream" for i in range(rooms)] if rooms > 0 else ['/stream']
+    streams = []
+    for route in routes:
+        for _ in range(perRoom):
+            sock = socket.create_connection((host, port), timeout=5)
+            sock.sendall(f"GET {route} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            if sock.recv(4096).startswith(b"HTTP/1.1 200"):  # the headers, usually with the first event.
+                streams.append(sock)
+            else:
+                sock.close()
+    return streams
+
+
+# this function reads whatever the streams were sent while the benchmark ran, then closes them.
+# it returns how many were still open and how many counter events they got between them.
+def CloseStreams(streams):
+    time.sleep(0.5)  # gives the last events time to arrive.
+    live = 0
+    events = 0
+    for sock in streams:
+        sock.setblocking(False)
+        isOpen = True
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    isOpen = False  # the server closed (or dropped) this stream.
+                    break
+                events += chunk.count(b"data:")
+        except BlockingIOError:
+            pass  # nothing more to read right now.
+        except OSError:
+            isOpen = False
+        live += isOpen
+        sock.close()
+    return live, events
+
+
+# this function prints one line of results.
+def PrintResult(result):
+    print(f"{result['route']:<12} {result['rps']:>9.1f} req/s   p50 {result['p50'] * 1000:7.2f} ms   "
+          f"p99 {result['p99'] * 1000:7.2f} ms   ok {result['requests']}   errors {result['errors']}")
+
+
+# this function acts like one ClientApp: it presses the increment button pressCount times with a short random pause in between,
+# sending each press to /delta with its own idempotency key and retrying on errors the way the outbox does.
+def RunSimulatedClient(host, port, routePrefix, pressCount, thinkTime, latencies, acknowledged, errors):
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    for _ in range(pressCount):
+        body = json.dumps({'delta': 1, 'key': uuid.uuid4().hex})
+        for attempt in range(3):
+            start = time.perf_counter()
+            try:
+                connection.request('POST', f"{routePrefix}/delta", body=body, headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - start)
+                    acknowledged.append(1)
+                    break
+                errors.append(response.status)
+            except Exception as e:
+                errors.append(str(e))
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=5)
+        if thinkTime > 0:
+            time.sleep(random.uniform(0, thinkTime))
+    connection.close()
+
+
+# this function reads a counter with a plain GET.
+def ReadCounter(host, port, routePrefix):
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    connection.request('GET', f"{routePrefix}/query")
+    counter = json.loads(connection.getresponse().read())['counter']
+    connection.close()
+    return counter
+
+
+# this function runs N simulated clients against one counter and checks that every acknowledged press was counted.
+# it should be the only thing using that counter while it runs, otherwise the lost update count is meaningless.
+def RunClientSimulation(host, port, routePrefix, clients, pressesPerClient, thinkTime):
+    latencies = []
+    acknowledged = []
+    errors = []
+    startCounter = ReadCounter(host, port, routePrefix)
+    threads = [threading.Thread(target=RunSimulatedClient,
+                                args=(host, port, routePrefix, pressesPerClient, thinkTime, latencies, acknowledged, errors))
+               for _ in range(clients)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    counted = ReadCounter(host, port, routePrefix) - startCounter
+    latencies.sort()
+    print(f"{clients} clients x {pressesPerClient} presses: {len(acknowledged) / elapsed:.1f} presses/s")
+    print(f"p50 {Percentile(latencies, 50) * 1000:.2f} ms   p95 {Percentile(latencies, 95) * 1000:.2f} ms   "
+          f"p99 {Percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"acknowledged {len(acknowledged)}   counted {counted}   lost updates {len(acknowledged) - counted}   errors {len(errors)}")
+
+
+# this function measures how much memory each room takes by making rooms straight in the server's registry.
+# it only works when the server runs in this process (--serve).
+def MeasureRoomMemory(serverModule, roomCount):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(roomCount):
+        serverModule.rooms.GetRoom(f"memtest{i}")
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    usedBytes = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    with serverModule.rooms.lock:
+        for i in range(roomCount):
+            serverModule.rooms.rooms.pop(f"memtest{i}", None)
+    return usedBytes / roomCount
+
+
+# this function waits until the server is accepting connections, so the benchmark doesn't start too early.
+def WaitForServer(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request('GET', '/query')
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except Exception:
+            time.sleep(0.1)
+    return False
+
+
+# This runs when you execute the script.
+# Example: python LoadTest.py --serve threaded --clients 64 --requests 200
+#          python LoadTest.py --serve threaded --clients 64 --rooms 40 --streams 30   (needs ulimit -n above 2 * 40 * 30)
+#          python LoadTest.py --port 5000 --simulate --clients 40 --requests 50   (against python ServerMain.py --headless)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load benchmark for the counter API (/increment and /query).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=32, help="number of clients sending at the same time")
+    parser.add_argument('--requests', type=int, default=200, help="requests sent by each client")
+    parser.add_argument('--serve', choices=['threaded', 'waitress', 'werkzeug'],
+                        help="start the counter API in this process with the given backend instead of using a running server")
+    parser.add_argument('--workers', type=int, default=128)
+    parser.add_argument('--backlog', type=int, default=256)
+    parser.add_argument('--rooms', type=int, default=0, help="spread the clients over this many /rooms/<id> counters")
+    parser.add_argument('--streams', type=int, default=0,
+                        help="keep this many /stream subscribers open per room (or on /stream) while the benchmark runs")
+    parser.add_argument('--simulate', action='store_true',
+                        help="simulate ClientApp users pressing the button and report lost updates instead of the raw route benchmark")
+    parser.add_argument('--room', help="with --simulate, use this room instead of the presenter's counter")
+    parser.add_argument('--think-ms', type=float, default=20, help="with --simulate, the longest random pause between presses")
+    args = parser.parse_args()
+
+    if args.serve:
+        import CounterServer
+        if args.rooms > 0:
+            print(f"memory per room: {MeasureRoomMemory(CounterServer, args.rooms):.0f} bytes")
+        serverThread = threading.Thread(target=CounterServer.RunCounterServer,
+                                        args=(args.serve, args.host, args.port, args.workers, args.backlog), daemon=True)
+        serverThread.start()
+
+    if not WaitForServer(args.host, args.port):
+        print(f"Could not reach the server at http://{args.host}:{args.port}")
+        sys.exit(1)
+
+    if args.simulate:
+        routePrefix = f"/rooms/{args.room}" if args.room else ""
+        RunClientSimulation(args.host, args.port, routePrefix, args.clients, args.requests, args.think_ms / 1000)
+        sys.exit(0)
+
+    print(f"{args.clients} clients x {args.requests} requests each")
+    streams = []
+    if args.streams > 0:
+        streams = OpenStreams(args.host, args.port, args.rooms, args.streams)
+        print(f"{len(streams)} of {args.streams * max(1, args.rooms)} stream subscribers connected")
+    if args.rooms > 0:
+        print(f"spread over {args.rooms} rooms")
+        processStart = time.process_time()
+        PrintResult(RunBenchmark(args.host, args.port, 'POST', '/rooms/{room}/increment', args.clients, args.requests, args.rooms))
+        PrintResult(RunBenchmark(args.host, args.port, 'GET', '/rooms/{room}/query', args.clients, args.requests, args.rooms))
+        if args.serve:  # the CPU time includes the clients too, so it is an upper bound for the server's share.
+            print(f"CPU time per room: {(time.process_time() - processStart) / args.rooms * 1000:.1f} ms")
+    else:
+        PrintResult(RunBenchmark(args.host, args.port, 'POST', '/increment', args.clients, args.requests))
+        PrintResult(RunBenchmark(args.host, args.port, 'GET', '/query', args.clients, args.requests))
+
+    if streams:
+        live, events = CloseStreams(streams)
+        print(f"streams still open after the benchmark: {live} of {len(streams)}, counter events received: {events}")
@@ -0,0 +1,105 @@
+import math
+import time
+import random
+
+
+# This class is the presentation countdown. It never counts ticks: the time left is always worked out from a deadline
+# on the monotonic clock, so a GUI tick that arrives late (while a frame is being scaled, for example) can't make the
+# countdown fall behind, and the alerts fire by comparing against the deadline, so a late tick can't skip one either.
+# clock can be swapped for a fake one, which is how the stall check at the bottom of this file runs in no time.
+class PresentationTimer:
+    def __init__(self, duration, alertTimes=(), clock=time.monotonic):
+        self.duration = duration  # seconds.
+        self.alertTimes = sorted(alertTimes, reverse=True)  # seconds left at which an alert goes off, earliest first.
+        self.clock = clock
+        self.deadline = None  # clock time the presentation should end at, moves later while paused.
+        self.pausedAt = None
+        self.firedAlerts = set()
+        self.overtimeFired = False
+
+    # this function starts the countdown from the full duration.
+    def Start(self):
+        self.deadline = self.clock() + self.duration
+        self.pausedAt = None
+        self.firedAlerts.clear()
+        self.overtimeFired = False
+
+    # this function stops the countdown where it is. pausing twice does nothing.
+    def Pause(self):
+        if self.pausedAt is None:
+            self.pausedAt = self.clock()
+
+    # this function carries on from where Pause stopped, the deadline moves later by however long it was paused.
+    def Resume(self):
+        if self.pausedAt is not None:
+            self.deadline += self.clock() - self.pausedAt
+            self.pausedAt = None
+
+    def IsPaused(self):
+        return self.pausedAt is not None
+
+    # this function returns the exact seconds left, negative once the presentation is over time.
+    def Remaining(self, now=None):
+        if self.pausedAt is not None:
+            now = self.pausedAt
+        elif now is None:
+            now = self.clock()
+        return self.deadline - now
+
+    # this function returns the whole seconds shown on the timer. it shows the full duration for the first second,
+    # just like counting down once per second did, and goes below 0 once over time.
+    def SecondsLeft(self, now=None):
+        return math.ceil(self.Remaining(now))
+
+    # this function returns the alert times that have been reached since the last call (each one only once),
+    # and whether the presentation has just gone over time.
+    def DueAlerts(self, now=None):
+        secondsLeft = self.SecondsLeft(now)
+        due = [alert for alert in self.alertTimes if secondsLeft <= alert and alert not in self.firedAlerts]
+        self.firedAlerts.update(due)
+        overtime = secondsLeft <= 0 and not self.overtimeFired
+        self.overtimeFired = self.overtimeFired or overtime
+        return due, overtime
+
+
+# this function plays a 20 minute talk through the timer on a fake clock with a tick every 16 ms and random GUI stalls
+# of up to 3 seconds (plus a pause in the middle), and checks the shown time against the real time left on every tick.
+def RunStallCheck(duration=20 * 60, alertTimes=(10 * 60, 5 * 60), seed=1):
+    rng = random.Random(seed)
+    fakeNow = [1000.0]
+    timer = PresentationTimer(duration, alertTimes, clock=lambda: fakeNow[0])
+    timer.Start()
+
+    pausedFor = 0.0
+    maxDrift = 0
+    firedAt = {}
+    elapsed = 0.0
+    while elapsed < duration + 30:
+        if rng.random() < 0.01:
+            fakeNow[0] += rng.uniform(0.2, 3.0)  # the GUI thread was busy.
+        else:
+            fakeNow[0] += 0.016
+        if pausedFor == 0.0 and elapsed > duration / 2:
+            timer.Pause()
+            fakeNow[0] += 90
+            timer.Resume()
+            pausedFor = 90.0
+        elapsed = fakeNow[0] - 1000.0 - pausedFor
+
+        expected = math.ceil(duration - elapsed)
+        maxDrift = max(maxDrift, abs(timer.SecondsLeft() - expected))
+        due, overtime = timer.DueAlerts()
+        for alert in due:
+            firedAt[alert] = expected
+        if overtime:
+            firedAt['overtime'] = expected
+
+    print(f"max drift: {maxDrift} s")
+    for alert in list(alertTimes) + ['overtime']:
+        print(f"alert {alert}: fired at {firedAt.get(alert)} s left")
+    return maxDrift == 0 and len(firedAt) == len(alertTimes) + 1
+
+
+# This runs when you execute the script, it runs the stall check and exits with 1 if the countdown drifted.
+if __name__ == '__main__':
+    raise SystemExit(0 if RunStallCheck() else 1)
@@ -1,65 +1,778 @@
 import sys
+
+# the counter API alone needs neither Qt nor OpenCV, so --headless starts it before either of them is imported.
+if __name__ == '__main__' and '--headless' in sys.argv[1:]:
+    from CounterServer import RunCounterServer
+    RunCounterServer()
+    sys.exit(0)
+
 import cv2
+import numpy as np
 import time
 import os
 import datetime
-from fer import FER
+import argparse
+import multiprocessing
+import queue
+import threading
+import sqlite3
+from collections import deque
 from PyQt5 import uic
-from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QSizePolicy
-from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot, QTimer, Qt, QUrl
-from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QSizePolicy, QLabel, QShortcut
+from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot, QTimer, QUrl
+from PyQt5.QtGui import QImage, QPixmap, QKeySequence
 # Switched from QMediaPlayer to QSoundEffect for lower latency
 from PyQt5.QtMultimedia import QSoundEffect
-from flask import Flask, jsonify, request
+from CounterServer import counterStore, metrics, sessionLog, RunCounterServer
+from FramePipeline import SharedFrameRing, CaptureProcessMain, InferenceProcessMain
+from SessionStore import SessionStore
+from PresentationTimer import PresentationTimer
+from SessionLog import EVENT_EMOTION, EVENT_RESET
 
 # CONSTANTS
+APP_START_TIME = time.monotonic()  # used to measure time-to-first-frame and time-to-first-emotion.
 HAPPY_THRESHOLD = 50  # this constant defines how easy it is for the presenter to make FER detect you are happpy.
 
-appState = {'counter': 0}  # this is where the "Uh counter" is stored
-flaskApp = Flask(__name__)  # intializes Flask
-
-
-# This section handles the two pyqtSignal's that are used to communicate between threads.
+# these settings control the camera. a width/height/fps of 0 keeps whatever the camera uses by default.
+# the source can be a camera index ("0"), a video file path, or a network stream URL like rtsp://...
+TARGET_DISPLAY_FPS = float(os.environ.get('SANE_DISPLAY_FPS', '30'))  # the preview is never updated faster than this, 0 means no limit.
+CAPTURE_SOURCE = os.environ.get('SANE_CAPTURE_SOURCE', '0')
+CAPTURE_BACKEND = os.environ.get('SANE_CAPTURE_BACKEND', 'auto')  # 'auto', 'v4l2', 'ffmpeg', 'gstreamer', 'dshow' or 'msmf'.
+CAPTURE_FOURCC = os.environ.get('SANE_CAPTURE_FOURCC', '')  # 'MJPG' lets most USB cameras send high resolutions at full speed.
+CAPTURE_WIDTH = int(os.environ.get('SANE_CAPTURE_WIDTH', '0'))
+CAPTURE_HEIGHT = int(os.environ.get('SANE_CAPTURE_HEIGHT', '0'))
+CAPTURE_FPS = float(os.environ.get('SANE_CAPTURE_FPS', '0'))
+CAPTURE_BUFFER_SIZE = 1  # only one frame waits in the driver, so we never display an old frame.
+CAPTURE_BACKENDS = {'auto': 'CAP_ANY', 'v4l2': 'CAP_V4L2', 'ffmpeg': 'CAP_FFMPEG', 'gstreamer': 'CAP_GSTREAMER',
+                    'dshow': 'CAP_DSHOW', 'msmf': 'CAP_MSMF'}
+FRAME_PIPELINE = os.environ.get('SANE_FRAME_PIPELINE', 'threads')  # 'threads' (one process) or 'processes' (capture and inference in their own processes).
+INFERENCE_PROCESSES = int(os.environ.get('SANE_INFERENCE_PROCESSES', '2'))  # how many inference processes the 'processes' pipeline starts, each gets its own EMOTION_CPU_BUDGET.
+STREAM_CAPTURE_OPTIONS = 'rtsp_transport;tcp|fflags;nobuffer|flags;low_delay'  # FFmpeg options that cut network stream latency.
+
+# these settings control the face detection. 'mtcnn' is the most accurate but slowest, 'haar' is the fastest,
+# and 'dnn' uses OpenCV's SSD face detector (it needs the two model files below, otherwise it falls back to 'haar').
+FACE_DETECTOR = os.environ.get('SANE_FACE_DETECTOR', 'mtcnn')
+DNN_PROTOTXT = os.environ.get('SANE_DNN_PROTOTXT', 'deploy.prototxt')
+DNN_MODEL = os.environ.get('SANE_DNN_MODEL', 'res10_300x300_ssd_iter_140000.caffemodel')
+DNN_CONFIDENCE = 0.5  # faces the DNN is less sure about than this are ignored.
+FULL_DETECTION_INTERVAL = 2  # seconds between full-frame face detections, in between the faces are tracked.
+EMOTION_REFRESH_SECONDS = 0.25  # how often a frame is normally sent to the inference worker to refresh the emotion feedback.
+EMOTION_CPU_BUDGET = float(os.environ.get('SANE_EMOTION_CPU_BUDGET', '0.5'))  # share of one CPU core the emotion model may use on average,
+# per inference process in the 'processes' pipeline, so there the model may use EMOTION_CPU_BUDGET * INFERENCE_PROCESSES cores in total.
+MIN_DETECTION_INTERVAL = 0.1  # the emotion detection never runs more often than this many seconds, however cheap it is.
+MAX_DETECTION_INTERVAL = 2.0  # and it always runs at least this often, even if nothing in the picture changed.
+SCENE_CHANGE_THRESHOLD = 12.0  # average pixel change (0-255) on a tiny thumbnail that counts as a big change.
+STATIC_SCENE_THRESHOLD = 2.0  # average pixel change below this counts as nothing happening.
+DETECTION_MAX_WIDTH = 640  # frames are shrunk to this width before looking for faces, the boxes are scaled back up after.
+EMOTION_BATCH_FRAMES = 4  # up to this many recent frames waiting for the worker are classified together in one call.
+FACE_TILE_SIZE = 96  # every face crop is resized to this many pixels before it goes to the classifier.
+FACE_TILE_MARGIN = 0.15  # extra space kept around each face crop, FER looks a little outside the box it is given.
+HAPPY_SMOOTHING = 0.3  # how much each new happy score counts in the moving average (1 would mean no smoothing).
+
+# audience mode points the camera at the room instead of the presenter and scores every face it can see.
+AUDIENCE_MODE = os.environ.get('SANE_AUDIENCE_MODE', '0') == '1'
+AUDIENCE_MAX_FACES = 40  # the largest (closest) faces are kept if more than this many are found.
+AUDIENCE_DETECTION_MAX_WIDTH = 1280  # faces at the back of a room are small, so audience frames are shrunk less before detection.
+EMOTION_LATENCY_BUDGET = 0.5  # seconds one batch of face crops may take to classify, older frames are left out of the batch first.
+AUDIENCE_HISTOGRAM_BINS = 5  # how many happy score ranges (0-20, 20-40, ...) the audience histogram shows.
+
+RENDER_TICK_MS = 16  # the labels and their blink/flash effects are repainted from one timer this often (about one frame).
+FLASH_SECONDS = 3  # how long the counter label flashes after an increment.
+FLASH_TOGGLE_SECONDS = 0.2  # how long each red/black half of the counter flash lasts.
+BLINK_TOGGLE_SECONDS = 0.5  # how long each half of the orange/red time label blink lasts.
+ORANGE_ALERT_SECONDS = 5  # how long the orange warning blinks when an alert time is reached.
+COUNTER_STYLE = "background-color: #000000; color: white;"
+COUNTER_FLASH_STYLE = "background-color: red; color: black;"
+
+
+# This section handles the pyqtSignal that is used to tell the GUI thread the counter changed.
+# It only fires once per batch of changes, the GUI then reads the latest value straight from the counter store.
 class ServerSignals(QThread):
-    updateCounter = pyqtSignal(int)
-    flashSignal = pyqtSignal()
+    counterChanged = pyqtSignal()
 
 
 serverSignals = ServerSignals()
+counterStore.onDirty = serverSignals.counterChanged.emit
+
+
+# This class finds faces and classifies their emotions. A full face detection (MTCNN, Haar cascade or OpenCV DNN) only runs every
+# FULL_DETECTION_INTERVAL seconds. In between, the faces are followed with a cheap OpenCV tracker and FER only has to classify
+# the face crops, which is what lets the emotion feedback refresh several times per second on a laptop CPU.
+class EmotionDetector:
+    def __init__(self, backend=FACE_DETECTOR, audience=AUDIENCE_MODE):
+        if backend == 'dnn' and not (os.path.exists(DNN_PROTOTXT) and os.path.exists(DNN_MODEL)):
+            print(f"DNN face model files not found ({DNN_PROTOTXT}, {DNN_MODEL}), using the Haar cascade instead.")
+            backend = 'haar'
+
+        # fer pulls in TensorFlow, which takes seconds to import, so it is only imported when a detector is actually made.
+        from fer import FER
+
+        self.backend = backend
+        self.fer = FER(mtcnn=(backend == 'mtcnn'))  # FER uses its Haar cascade when mtcnn is off.
+        self.faceNet = cv2.dnn.readNetFromCaffe(DNN_PROTOTXT, DNN_MODEL) if backend == 'dnn' else None
+        self.trackedFaces = None  # list of (tracker, box) pairs, None means a full detection is needed.
+        self.lastFullDetection = 0.0
+        self.audience = audience
+        self.maxWidth = AUDIENCE_DETECTION_MAX_WIDTH if audience else DETECTION_MAX_WIDTH
+        self.maxFaces = AUDIENCE_MAX_FACES if audience else None
+        self.cropCost = 0.0  # moving average of the seconds tracking and classifying one face crop takes.
+
+    # this function takes a few recent frames (oldest first) and returns the faces and emotions for the newest one,
+    # in the same format as FER.detect_emotions. every face crop from every frame is classified in a single FER call,
+    # and each face's emotions are averaged over the frames.
+    # now can be passed in to use a different clock (the replay benchmark uses the video's own time so runs are repeatable).
+    def Analyze(self, frames, now=None):
+        newestFrame = frames[-1]
+        boxesPerFrame = None
+
+        if now is None:
+            now = time.monotonic()
+        trackingTime = 0.0
+        if self.trackedFaces is not None and now - self.lastFullDetection < FULL_DETECTION_INTERVAL:
+            # in audience mode only the newest frame is tracked. with dozens of faces, tracking every frame of the batch costs
+            # more than the older frames add, and a face the tracker loses is left out until the next full detection.
+            trackStart = time.perf_counter()
+            boxesPerFrame = []
+            for frame in (frames[-1:] if self.audience else frames):
+                boxes = self.TrackFaces(frame, dropLost=self.audience)
+                if boxes is None:
+                    boxesPerFrame = None  # a face was lost, so it falls through to a full detection.
+                    break
+                boxesPerFrame.append((frame, boxes))
+            trackingTime = time.perf_counter() - trackStart
+
+        if boxesPerFrame is None:
+            boxes = self.DetectFaces(newestFrame)
+            self.lastFullDetection = now
+            self.StartTracking(newestFrame, boxes)
+            boxesPerFrame = [(newestFrame, boxes)]
+
+        newestBoxes = boxesPerFrame[-1][1]
+        if not newestBoxes:
+            return []
+
+        # keeps the batch inside EMOTION_LATENCY_BUDGET: the older frames are dropped first, then the smallest faces.
+        cropLimit = int(EMOTION_LATENCY_BUDGET / self.cropCost) if self.cropCost > 0 else None
+        if cropLimit is not None:
+            faceCount = len(newestBoxes)
+            boxesPerFrame = boxesPerFrame[-max(1, cropLimit // faceCount):]
+            if faceCount > cropLimit:
+                newestBoxes = newestBoxes[:max(1, cropLimit)]  # the boxes are kept largest first.
+                boxesPerFrame = [(boxesPerFrame[-1][0], newestBoxes)]
+
+        crops = [self.CropFace(frame, box) for frame, boxes in boxesPerFrame for box in boxes]
+        startTime = time.perf_counter()
+        emotionsList = self.ClassifyCrops(crops)
+        cost = (trackingTime + time.perf_counter() - startTime) / len(crops)  # tracking grows with the faces too, so it counts.
+        self.cropCost = cost if self.cropCost == 0.0 else self.cropCost + 0.2 * (cost - self.cropCost)
+
+        # the emotions become a (frames, faces, emotions) array so each face's average over the batch is one mean.
+        labels = list(emotionsList[0])
+        scores = np.array([[emotions[label] for label in labels] for emotions in emotionsList], dtype=np.float32)
+        scores = scores.reshape(len(boxesPerFrame), len(newestBoxes), len(labels)).mean(axis=0)
+        return [{'box': list(box), 'emotions': dict(zip(labels, faceScores.tolist()))}
+                for box, faceScores in zip(newestBoxes, scores)]
+
+    # this function finds faces on a shrunk copy of the frame and returns the boxes in full resolution coordinates.
+    def DetectFaces(self, frame):
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.maxWidth / w)
+        smallFrame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else frame
+
+        if self.faceNet is not None:
+            smallBoxes = self.DetectFacesDnn(smallFrame)
+        else:
+            smallBoxes = self.fer.find_faces(smallFrame, bgr=True)
+
+        boxes = []
+        for x, y, bw, bh in smallBoxes:
+            box = self.ClampBox((int(x / scale), int(y / scale), int(bw / scale), int(bh / scale)), w, h)
+            if box is not None:
+                boxes.append(box)
+        # largest (closest) first, the tracker keeps this order, so trimming a batch always drops the smallest faces.
+        boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+        return boxes[:self.maxFaces] if self.maxFaces is not None else boxes
+
+    # this function cuts a square face crop with a small margin around it out of the frame.
+    def CropFace(self, frame, box):
+        h, w = frame.shape[:2]
+        x, y, bw, bh = box
+        side = max(bw, bh) * (1 + 2 * FACE_TILE_MARGIN)
+        centerX, centerY = x + bw / 2, y + bh / 2
+        x1, y1 = max(0, int(centerX - side / 2)), max(0, int(centerY - side / 2))
+        x2, y2 = min(w, int(centerX + side / 2)), min(h, int(centerY + side / 2))
+        return frame[y1:y2, x1:x2]
+
+    # this function puts every crop on one image in a square-ish grid and lets FER classify them all in a single call.
+    # the gaps between the tiles are wide enough that FER's own padding around each box never reaches the next face.
+    def ClassifyCrops(self, crops):
+        tile = FACE_TILE_SIZE
+        gap = tile // 2
+        inset = int(tile * FACE_TILE_MARGIN / (1 + 2 * FACE_TILE_MARGIN))  # where the face itself starts inside the tile.
+        columns = int(np.ceil(np.sqrt(len(crops))))
+        rows = int(np.ceil(len(crops) / columns))
+        sheet = np.zeros((gap + rows * (tile + gap), gap + columns * (tile + gap), 3), dtype=np.uint8)
+
+        rectangles = []
+        for i, crop in enumerate(crops):
+            x = gap + (i % columns) * (tile + gap)
+            y = gap + (i // columns) * (tile + gap)
+            sheet[y:y + tile, x:x + tile] = cv2.resize(crop, (tile, tile), interpolation=cv2.INTER_AREA)
+            rectangles.append((x + inset, y + inset, tile - 2 * inset, tile - 2 * inset))
+
+        return [face['emotions'] for face in self.fer.detect_emotions(sheet, face_rectangles=rectangles)]
+
+    # this function finds faces with the OpenCV DNN detector and returns them as (x, y, w, h) boxes.
+    def DetectFacesDnn(self, frame):
+        h, w = frame.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.faceNet.setInput(blob)
+        detections = self.faceNet.forward()
+
+        boxes = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < DNN_CONFIDENCE:
+                continue
+            x1, y1, x2, y2 = (detections[0, 0, i, 3:7] * np.array([w, h, w, h])).astype(int)
+            box = self.ClampBox((x1, y1, x2 - x1, y2 - y1), w, h)
+            if box is not None:
+                boxes.append(box)
+        return boxes
+
+    # this function runs the face finder and the classifier once on blank images, so TensorFlow builds its graph now
+    # instead of when the first real face shows up.
+    def WarmUp(self):
+        self.DetectFaces(np.zeros((480, 640, 3), dtype=np.uint8))
+        self.ClassifyCrops([np.zeros((FACE_TILE_SIZE, FACE_TILE_SIZE, 3), dtype=np.uint8)])
+
+    # this function sets up one tracker per face. if OpenCV has no tracker available the box just stays where it was found.
+    def StartTracking(self, frame, boxes):
+        self.trackedFaces = []
+        for box in boxes:
+            box = tuple(int(v) for v in box)
+            tracker = CreateTracker()
+            if tracker is not None:
+                tracker.init(frame, box)
+            self.trackedFaces.append((tracker, box))
+
+    # this function moves every tracked box to where the face is now. it returns None if a face was lost, so a full detection runs.
+    # with dropLost a lost face is just forgotten instead, and None only comes back once every tracked face is gone.
+    def TrackFaces(self, frame, dropLost=False):
+        h, w = frame.shape[:2]
+        boxes = []
+        updatedFaces = []
+        for tracker, box in self.trackedFaces:
+            if tracker is not None:
+                ok, newBox = tracker.update(frame)
+                box = self.ClampBox(tuple(int(v) for v in newBox), w, h) if ok else None
+                if box is None:
+                    if dropLost:
+                        continue
+                    return None
+            boxes.append(box)
+            updatedFaces.append((tracker, box))
+        if self.trackedFaces and not updatedFaces:
+            return None
+        self.trackedFaces = updatedFaces
+        return boxes
+
+    # this function keeps a box inside the frame. it returns None if nothing of the box is left.
+    @staticmethod
+    def ClampBox(box, frameWidth, frameHeight):
+        x, y, bw, bh = box
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(frameWidth, x + bw), min(frameHeight, y + bh)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return (x1, y1, x2 - x1, y2 - y1)
+
+
+# this function sums up the whole audience from one detection result: how many faces, their average happy score,
+# the percentage at or above HAPPY_THRESHOLD, the average engagement (100 minus the neutral score) and a histogram
+# of the happy scores. all the scores are in percent, like the single face score.
+def AggregateAudience(result):
+    if not result:
+        return None
+    happy = np.array([face['emotions']['happy'] for face in result], dtype=np.float32) * 100
+    neutral = np.array([face['emotions'].get('neutral', 0.0) for face in result], dtype=np.float32) * 100
+    histogram, _ = np.histogram(happy, bins=AUDIENCE_HISTOGRAM_BINS, range=(0, 100))
+    return {'faces': len(result),
+            'happyMean': float(happy.mean()),
+            'smilingPercent': float((happy >= HAPPY_THRESHOLD).mean() * 100),
+            'engagement': float((100 - neutral).mean()),
+            'histogram': histogram.tolist()}
+
+
+# this function creates the cheapest OpenCV tracker this OpenCV build has, or None if it has none.
+def CreateTracker():
+    for name in ('TrackerKCF_create', 'TrackerCSRT_create', 'TrackerMIL_create'):
+        for module in (cv2, getattr(cv2, 'legacy', None)):
+            if module is not None and hasattr(module, name):
+                return getattr(module, name)()
+    return None
+
+
+# This class decides which frames are worth sending to the emotion model. It keeps a moving average of how long one
+# inference takes and never sends frames faster than EMOTION_CPU_BUDGET allows (cost / budget seconds apart).
+# Within that limit it compares a tiny grayscale thumbnail against the one from the last detection: a big change
+# runs the detection early, a frame where nothing moved is skipped until MAX_DETECTION_INTERVAL has passed.
+class DetectionScheduler:
+    def __init__(self, cpuBudget=EMOTION_CPU_BUDGET):
+        self.cpuBudget = cpuBudget
+        self.averageCost = 0.0  # seconds one inference takes, updated from every result.
+        self.lastDetectionTime = -MAX_DETECTION_INTERVAL
+        self.lastThumbnail = None  # what the scene looked like at the last detection.
+
+    # this function adds the time one inference took to the moving average.
+    def RecordCost(self, seconds):
+        self.averageCost = seconds if self.averageCost == 0.0 else self.averageCost + 0.2 * (seconds - self.averageCost)
+
+    # this function returns the shortest gap between detections the CPU budget allows.
+    def BudgetInterval(self):
+        return min(MAX_DETECTION_INTERVAL, max(MIN_DETECTION_INTERVAL, self.averageCost / self.cpuBudget))
+
+    # this function returns True if this frame should be sent to the emotion model.
+    def ShouldDetect(self, frame, now):
+        elapsed = now - self.lastDetectionTime
+        shortestInterval = self.BudgetInterval()
+        if elapsed < shortestInterval:
+            return False  # the thumbnail isn't even worked out, so skipped frames cost almost nothing.
+
+        thumbnail = cv2.cvtColor(cv2.resize(frame, (64, 48), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if self.lastThumbnail is None or elapsed >= MAX_DETECTION_INTERVAL:
+            detect = True
+        else:
+            change = cv2.absdiff(thumbnail, self.lastThumbnail).mean()
+            if change >= SCENE_CHANGE_THRESHOLD:
+                detect = True  # something big happened, so it runs as soon as the budget allows.
+            elif change <= STATIC_SCENE_THRESHOLD:
+                detect = False  # nothing moved, the last result is still good.
+            else:
+                detect = elapsed >= max(EMOTION_REFRESH_SECONDS, shortestInterval)
 
+        if detect:
+            self.lastDetectionTime = now
+            self.lastThumbnail = thumbnail
+        return detect
 
-# Links function to a flask route. whenever /query is accessed, the function returns the current "ah counter"
-@flaskApp.route('/query', methods=['GET'])
-def Query():
-    return jsonify({'counter': appState['counter']})
 
+# This class runs the FER emotion detection on its own thread so the camera preview never has to wait on the model.
+# The model itself is also loaded and warmed up on this thread, so the window and the preview show up right away;
+# modelReady tells the GUI when it is done (True) or if it failed to load (False).
+# It only holds the last few frames (latest frames win), so once EMOTION_BATCH_FRAMES are waiting the oldest one is dropped.
+# Whatever is waiting when the model is free gets analysed together as one batch.
+class InferenceWorker(QThread):
+    resultReady = pyqtSignal(list, float)
+    modelReady = pyqtSignal(bool)
 
-# links function to this flask route. whenever /incrmenet ic accessed, the function incrmeents the value insideo of the counter dictionary.
-@flaskApp.route('/increment', methods=['POST'])
-def IncrementCounter():
-    appState['counter'] += 1
-    serverSignals.updateCounter.emit(appState['counter'])
-    serverSignals.flashSignal.emit()
-    return jsonify({'success': True, 'counter': appState['counter']})
+    def __init__(self, createDetector):
+        super().__init__()
+        self.createDetector = createDetector  # called on the worker thread to build the detector.
+        self.detector = None
+        self.frameCondition = threading.Condition()  # guards the pending frames below.
+        self.pendingFrames = deque(maxlen=EMOTION_BATCH_FRAMES)  # the newest frames waiting to be analysed.
+        self.keepRunning = True
+
+    # this function adds a frame to the pending frames, pushing out the oldest one if it is full. it never blocks the caller.
+    def SubmitFrame(self, frame):
+        with self.frameCondition:
+            self.pendingFrames.append(frame)
+            self.frameCondition.notify()
+
+    # this function tells the worker to finish and waits for the thread to exit.
+    def Stop(self):
+        with self.frameCondition:
+            self.keepRunning = False
+            self.frameCondition.notify()
+        self.wait()
+
+    # this function loads the model, then waits for frames, runs the model on them and sends the result back through the signal.
+    def run(self):
+        try:
+            with metrics.Time('model_load'):
+                self.detector = self.createDetector()
+                self.detector.WarmUp()
+        except Exception as e:
+            print(f"Could not load the emotion model: {e}")
+            self.modelReady.emit(False)
+            return
+        self.modelReady.emit(True)
+
+        while True:
+            with self.frameCondition:
+                while not self.pendingFrames and self.keepRunning:
+                    self.frameCondition.wait()
+                if not self.keepRunning:
+                    return
+                frames = list(self.pendingFrames)
+                self.pendingFrames.clear()
+
+            start = time.perf_counter()
+            try:
+                result = self.detector.Analyze(frames)
+            except Exception as e:
+                print(f"Inference Error: {e}")
+                continue
+            cost = time.perf_counter() - start
+            metrics.Record('detect_emotions', cost)
+            self.resultReady.emit(result, cost)
+
+
+# This class is the optional multi-process version of CaptureThread + InferenceWorker (SANE_FRAME_PIPELINE=processes).
+# The camera is read in its own process straight into a shared memory ring (see FramePipeline.py), a pool of inference
+# processes each load their own model, and only frame numbers and small results are sent between processes, never frames.
+# To the GUI it looks like a CaptureThread (frameReady, TakeFrame, ReturnFrame, Stop) that also sends resultReady and modelReady.
+class ProcessPipeline(QThread):
+    frameReady = pyqtSignal()
+    resultReady = pyqtSignal(list, float)
+    modelReady = pyqtSignal(bool)
+    sourceFailed = pyqtSignal(str)
+
+    def __init__(self, captureSource, createDetector, workerCount=INFERENCE_PROCESSES, targetFps=TARGET_DISPLAY_FPS):
+        super().__init__()
+        self.context = multiprocessing.get_context('spawn')  # forking a process that has Qt threads running isn't safe.
+        self.captureSource = captureSource
+        self.createDetector = createDetector
+        self.workerCount = max(1, workerCount)
+        self.frameInterval = 1 / targetFps if targetFps > 0 else 0
+
+        self.latestSeq = self.context.Value('q', -1, lock=False)
+        self.newFrameEvent = self.context.Event()
+        self.stopEvent = self.context.Event()
+        self.infoQueue = self.context.Queue()
+        self.taskQueue = self.context.Queue()
+        self.resultQueue = self.context.Queue()
+        self.processes = []
+        self.ring = None
+
+        self.frameLock = threading.Lock()
+        self.latestFrame = None  # the newest frame copied out of the ring that the GUI hasn't taken yet.
+        self.latestFrameTime = 0.0
+        self.latestFrameSeq = -1
+        self.takenSeq = -1  # the number of the frame the GUI took last, this is what SubmitTakenFrame sends for inference.
+        self.spareBuffers = []
+        self.signalPending = False
+        self.inFlight = 0  # frames sent to the inference processes that haven't come back yet.
+        self.newestResultSeq = -1
+
+    # this function starts the capture process, waits for its first frame, starts the inference processes and then keeps
+    # copying the newest frame out of the ring for the GUI.
+    def run(self):
+        captureProcess = self.context.Process(target=CaptureProcessMain, daemon=True,
+                                              args=(self.captureSource, self.infoQueue, self.latestSeq, self.newFrameEvent, self.stopEvent))
+        captureProcess.start()
+        self.processes.append(captureProcess)
 
+        info = None
+        while not self.stopEvent.is_set():
+            try:
+                info = self.infoQueue.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if not captureProcess.is_alive():
+                    break  # the capture process died before it could open the source.
+        if info is None:
+            self.sourceFailed.emit(f"Could not open video source: {self.captureSource.source}")
+            return
+        ringName, shape = info
+        self.ring = SharedFrameRing(shape, name=ringName)
+
+        for _ in range(self.workerCount):
+            worker = self.context.Process(target=InferenceProcessMain, daemon=True,
+                                          args=(self.createDetector, ringName, shape, self.taskQueue, self.resultQueue))
+            worker.start()
+            self.processes.append(worker)
+        threading.Thread(target=self.ReadResults, daemon=True).start()
+
+        nextEmitTime = 0.0
+        while not self.stopEvent.is_set():
+            if not self.newFrameEvent.wait(0.1):
+                continue
+            self.newFrameEvent.clear()
+
+            now = time.monotonic()
+            if now < nextEmitTime:
+                continue  # too soon for the display.
+            nextEmitTime = max(nextEmitTime + self.frameInterval, now)
+
+            with self.frameLock:
+                buffer = self.spareBuffers.pop() if self.spareBuffers else np.empty(self.ring.shape, dtype=np.uint8)
+            seq = self.latestSeq.value
+            capturedAt = self.ring.Read(seq, buffer)
+            if capturedAt is None:
+                self.ReturnFrame(buffer)
+                continue
+
+            with self.frameLock:
+                staleFrame = self.latestFrame
+                self.latestFrame, self.latestFrameTime, self.latestFrameSeq = buffer, capturedAt, seq
+                notifyGui = not self.signalPending
+                self.signalPending = True
+                if staleFrame is not None and len(self.spareBuffers) < 2:
+                    self.spareBuffers.append(staleFrame)
+            if notifyGui:
+                self.frameReady.emit()
+
+        self.ring.Close()
+
+    # this function runs on its own thread and passes the inference results on to the GUI, newest frames only.
+    def ReadResults(self):
+        readyCount = 0
+        failedCount = 0
+        while not self.stopEvent.is_set():
+            try:
+                message = self.resultQueue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if message[0] == 'ready':
+                if message[1]:
+                    readyCount += 1
+                    if readyCount == 1:
+                        self.modelReady.emit(True)
+                else:
+                    failedCount += 1
+                    if failedCount == self.workerCount:
+                        self.modelReady.emit(False)
+                continue
+
+            with self.frameLock:
+                self.inFlight -= 1
+            if message[0] == 'result':
+                _, seq, result, cost = message
+                metrics.Record('detect_emotions', cost)
+                if seq > self.newestResultSeq:  # results can come back out of order from different processes.
+                    self.newestResultSeq = seq
+                    self.resultReady.emit(result, cost)
+
+    # this function gives the GUI the newest frame and when it was captured, or (None, 0) if there isn't a new one.
+    def TakeFrame(self):
+        with self.frameLock:
+            frame = self.latestFrame
+            self.latestFrame = None
+            self.signalPending = False
+            if frame is not None:
+                self.takenSeq = self.latestFrameSeq
+            return frame, self.latestFrameTime
+
+    # this function gives a frame the GUI is done with back so its memory can be reused.
+    def ReturnFrame(self, frame):
+        with self.frameLock:
+            if len(self.spareBuffers) < 2:
+                self.spareBuffers.append(frame)
+
+    # this function sends the frame the GUI took last to the inference processes, unless every one of them is already busy.
+    def SubmitTakenFrame(self):
+        with self.frameLock:
+            if self.takenSeq < 0 or self.inFlight >= self.workerCount:
+                return
+            self.inFlight += 1
+            seq = self.takenSeq
+        self.taskQueue.put(seq)
+
+    # this function stops every process and waits for them to exit.
+    def Stop(self):
+        self.stopEvent.set()
+        for _ in range(self.workerCount):
+            self.taskQueue.put(None)
+        self.wait()
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+
+
+# This class describes where the video comes from (a camera index, a video file or a network stream) and opens it with
+# the configured backend, buffer size, FOURCC, resolution and FPS. Not every backend supports every setting, OpenCV just
+# ignores the ones it can't apply.
+class CaptureSource:
+    def __init__(self, source=CAPTURE_SOURCE, backend=CAPTURE_BACKEND, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT,
+                 fps=CAPTURE_FPS, fourcc=CAPTURE_FOURCC):
+        self.source = int(source) if str(source).isdigit() else source
+        self.backend = backend
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.isFile = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.isStream = isinstance(self.source, str) and '://' in self.source
+
+    # this function opens the source and returns the cv2.VideoCapture, or None if it couldn't be opened.
+    def Open(self):
+        if self.isStream:
+            # these only apply to the FFmpeg backend, and have to be set before the stream is opened.
+            os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', STREAM_CAPTURE_OPTIONS)
+
+        api = getattr(cv2, CAPTURE_BACKENDS.get(self.backend, 'CAP_ANY'), cv2.CAP_ANY)
+        params = []
+        if not isinstance(self.source, int) and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]  # lets files and streams decode on the GPU if it can.
+        cap = cv2.VideoCapture(self.source, api, params) if params else cv2.VideoCapture(self.source, api)
+        if not cap.isOpened():
+            cap.release()
+            return None
+
+        if not self.isFile:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, CAPTURE_BUFFER_SIZE)
+        if self.fourcc:  # some V4L2 drivers only take the FOURCC before the resolution, so it goes first.
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.width > 0 and self.height > 0:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps > 0:
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
+        return cap
+
+    # this function returns the rate a video file should be played back at, or 0 for live sources that set their own pace.
+    def PlaybackFps(self, cap):
+        if not self.isFile:
+            return 0
+        return cap.get(cv2.CAP_PROP_FPS) or 30
+
+
+# This class reads the camera on its own thread. cap.read() blocks until the camera has the next frame, so this thread just
+# sleeps in between and the GUI thread is free. Only the newest frame is kept, and the GUI is signalled at most TARGET_DISPLAY_FPS
+# times per second. The frame arrays are recycled between this thread and the GUI so no new buffer is allocated per frame.
+class CaptureThread(QThread):
+    frameReady = pyqtSignal()
+
+    # playbackFps is only set for video files, which would otherwise be read as fast as the disk allows. they loop at the end.
+    def __init__(self, cap, targetFps=TARGET_DISPLAY_FPS, playbackFps=0):
+        super().__init__()
+        self.cap = cap
+        self.frameInterval = 1 / targetFps if targetFps > 0 else 0
+        self.playbackInterval = 1 / playbackFps if playbackFps > 0 else 0
+        self.frameLock = threading.Lock()
+        self.latestFrame = None  # the newest frame the GUI hasn't taken yet.
+        self.latestFrameTime = 0.0  # when the newest frame came out of cap.read(), to measure how long it takes to reach the screen.
+        self.spareBuffers = []  # frames the GUI is done with, reused for the next cap.read().
+        self.signalPending = False  # True while a frameReady signal is waiting for the GUI.
+        self.keepRunning = True
+
+    # this function keeps reading frames and publishes them at the target rate.
+    def run(self):
+        buffer = None
+        nextEmitTime = 0.0
+        nextReadTime = 0.0
+        slack = self.frameInterval * 0.25  # lets frames that arrive a little early through, so camera jitter doesn't halve the FPS.
+
+        while self.keepRunning:
+            if self.playbackInterval > 0:  # plays video files back at their own speed.
+                delay = nextReadTime - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                nextReadTime = max(nextReadTime + self.playbackInterval, time.monotonic())
+
+            with metrics.Time('capture'):
+                ret, frame = self.cap.read(buffer)
+            if not ret:
+                buffer = None
+                if self.playbackInterval > 0:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # the video file ended, start it over.
+                self.msleep(10)  # the camera had nothing, wait a bit instead of spinning.
+                continue
+
+            now = time.monotonic()
+            if now + slack < nextEmitTime:
+                buffer = frame  # too soon for the display, the same buffer is read into again.
+                continue
+            nextEmitTime = max(nextEmitTime + self.frameInterval, now)
+
+            with self.frameLock:
+                staleFrame = self.latestFrame
+                self.latestFrame = frame
+                self.latestFrameTime = now
+                notifyGui = not self.signalPending
+                self.signalPending = True
+                if staleFrame is not None:
+                    buffer = staleFrame  # the GUI never took it, so it gets dropped and reused.
+                elif self.spareBuffers:
+                    buffer = self.spareBuffers.pop()
+                else:
+                    buffer = None
+
+            if notifyGui:
+                self.frameReady.emit()
+
+    # this function gives the GUI the newest frame and when it was captured, or (None, 0) if there isn't a new one.
+    def TakeFrame(self):
+        with self.frameLock:
+            frame = self.latestFrame
+            self.latestFrame = None
+            self.signalPending = False
+            return frame, self.latestFrameTime
+
+    # this function gives a frame the GUI is done with back to the capture thread so its memory can be reused.
+    def ReturnFrame(self, frame):
+        with self.frameLock:
+            if len(self.spareBuffers) < 2:
+                self.spareBuffers.append(frame)
+
+    # this function stops the thread and waits for the last cap.read() to finish.
+    def Stop(self):
+        self.keepRunning = False
+        self.wait()
+
+
+# This class turns camera frames into a pixmap for the preview while reusing the same buffers every frame.
+# Qt reads the BGR data directly (Format_BGR888, Qt 5.14+) so there is no color conversion, and the frame is resized once
+# with OpenCV into a buffer that already matches the label instead of Qt smooth-scaling a full size pixmap every frame.
+class FrameRenderer:
+    def __init__(self):
+        self.flipBuffer = None
+        self.scaledBuffer = None
+        self.rgbBuffer = None  # only used on older Qt versions that don't have Format_BGR888.
+        self.useBGR = hasattr(QImage, 'Format_BGR888')
+
+    # this function returns a (re)used buffer with the given shape, only allocating when the shape changes.
+    def GetBuffer(self, buffer, shape):
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    # this function mirrors the frame into the flip buffer and returns it.
+    def Mirror(self, frame):
+        self.flipBuffer = self.GetBuffer(self.flipBuffer, frame.shape)
+        cv2.flip(frame, 1, dst=self.flipBuffer)
+        return self.flipBuffer
+
+    # this function scales the frame so it covers the target size (like Qt.KeepAspectRatioByExpanding) and wraps it in a pixmap.
+    def Render(self, frame, targetWidth, targetHeight):
+        h, w = frame.shape[:2]
+        scale = max(targetWidth / w, targetHeight / h)
+        scaledW = max(1, round(w * scale))
+        scaledH = max(1, round(h * scale))
+
+        if (scaledW, scaledH) != (w, h):
+            self.scaledBuffer = self.GetBuffer(self.scaledBuffer, (scaledH, scaledW, 3))
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            with metrics.Time('scale'):
+                cv2.resize(frame, (scaledW, scaledH), dst=self.scaledBuffer, interpolation=interpolation)
+            frame = self.scaledBuffer
+
+        with metrics.Time('convert'):
+            if self.useBGR:
+                imageFormat = QImage.Format_BGR888
+            else:
+                self.rgbBuffer = self.GetBuffer(self.rgbBuffer, frame.shape)
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgbBuffer)
+                frame = self.rgbBuffer
+                imageFormat = QImage.Format_RGB888
 
-# links function to flask route. this section calls function whenever the /decrement is accessed and decrements whatever value is inside of the counter dictionary.
-@flaskApp.route('/decrement', methods=['POST'])
-def DecrementCounter():
-    appState['counter'] -= 1
-    serverSignals.updateCounter.emit(appState['counter'])
-    return jsonify({'success': True, 'counter': appState['counter']})
+            h, w, ch = frame.shape  # gets the different data about the image shape.
+            qtImage = QImage(frame.data, w, h, ch * w, imageFormat)  # wraps the buffer without copying it.
+            return QPixmap.fromImage(qtImage)  # this is the one copy Qt needs to put it on screen.
 
 
 # This section runs the server thread through flask so that the webserver can be accessed without interupting the other processes.
 class ServerThread(QThread):
     def run(self):
-        flaskApp.run(host='10.0.2.15', port=5000, debug=False)
+        RunCounterServer()
 
 
 # This class handles the SummaryPopup GUI. this GUI is what shows at the end of the presentation and displayed the presentation data.
 class SummaryPopup(QMainWindow):
-    def __init__(self, start_time, time_left, uh_count):
+    def __init__(self, start_time, time_left, uh_count, emotion_samples=0, smile_samples=0):
         super().__init__()
         uic.loadUi('popup.ui', self)
 
@@ -89,6 +802,32 @@ class SummaryPopup(QMainWindow):
         self.ContinueButton.clicked.connect(self.close)
         self.SaveDataButton.clicked.connect(self.SaveToFile)
 
+        self.SaveToHistory(emotion_samples, smile_samples)
+
+    # This function adds every finished presentation to the session history database, so trends over many rehearsals
+    # can be looked at later with python SessionStore.py stats (the text file is only written when the button is pressed).
+    def SaveToHistory(self, emotion_samples, smile_samples):
+        self.history_id = None
+        try:
+            store = SessionStore()
+            self.history_id = store.Record(self.start_time_val, self.actual_duration, self.uh_count_val,
+                                           emotion_samples, smile_samples)
+            store.Close()
+        # catches error if the database couldn't be written so the app doesn't crash.
+        except sqlite3.Error as e:
+            print(f"Error saving session history: {e}")
+
+    # This function records the text file's path on this session's history row, so SessionStore.py import skips the file.
+    def LinkHistoryToFile(self, full_path):
+        if self.history_id is None:
+            return
+        try:
+            store = SessionStore()
+            store.SetSource(self.history_id, full_path)
+            store.Close()
+        except sqlite3.Error as e:
+            print(f"Error saving session history: {e}")
+
     # This function saves the data that was shown in the summary pop up into a text file so that the presenter can view said data later.
     def SaveToFile(self):
         try:
@@ -112,6 +851,7 @@ class SummaryPopup(QMainWindow):
                 file.write(f"Total Uh Count:          {self.uh_count_val}\n")
 
             print(f"Successfully saved to: {full_path}")
+            self.LinkHistoryToFile(full_path)
 
             # closes the popup window after saving the data to the text file.
             self.close()
@@ -120,6 +860,43 @@ class SummaryPopup(QMainWindow):
             print(f"Error saving file: {e}")
 
 
+# This class collects the text and style each label should have and only passes the ones that actually changed on to Qt.
+# setStyleSheet makes Qt re-polish and re-layout the widget even when the style is the same as before, so the GUI code can
+# say what it wants as often as it likes and Flush applies just the differences, once per render tick.
+class LabelPainter:
+    def __init__(self):
+        self.wanted = {}  # label -> [text, style] it should show, None means it is left as it is.
+        self.applied = {}  # label -> [text, style] Qt was last given.
+
+    # this function records the text and/or style a label should have, nothing is drawn until Flush.
+    def Set(self, label, text=None, style=None):
+        wanted = self.wanted.setdefault(label, [None, None])
+        if text is not None:
+            wanted[0] = text
+        if style is not None:
+            wanted[1] = style
+
+    # this function returns the text the label will show after the next Flush.
+    def Text(self, label):
+        wanted = self.wanted.get(label)
+        return wanted[0] if wanted is not None and wanted[0] is not None else label.text()
+
+    # this function hands the changed texts and styles to Qt and returns how many it changed.
+    def Flush(self):
+        changes = 0
+        for label, (text, style) in self.wanted.items():
+            applied = self.applied.setdefault(label, [label.text(), None])
+            if text is not None and text != applied[0]:
+                label.setText(text)
+                applied[0] = text
+                changes += 1
+            if style is not None and style != applied[1]:
+                label.setStyleSheet(style)
+                applied[1] = style
+                changes += 1
+        return changes
+
+
 # This is the main server application window that has the facial recognition, presentation timing and the "uh counter"
 class CombinedApp(QMainWindow):
     def __init__(self):
@@ -129,10 +906,16 @@ class CombinedApp(QMainWindow):
         self.serverThread = ServerThread()  # initializes the server thread
         self.serverThread.start()  # starts the server thread running in background
 
-        serverSignals.updateCounter.connect(
-            self.UpdateCounterLabel)  # connects a server signal to updatecounter function
-        serverSignals.flashSignal.connect(self.StartFlash)  # connects server signal to flash signal function
-        serverSignals.flashSignal.connect(self.PlaySound)  # conects server siganl to play sound function.
+        # every label change and every blink/flash effect is drawn from this one timer. the rest of the GUI only records
+        # what the labels should look like in the label painter, which hands Qt just what changed since the last tick.
+        self.labelPainter = LabelPainter()
+        self.renderTimer = QTimer()
+        self.renderTimer.setInterval(RENDER_TICK_MS)
+        self.renderTimer.timeout.connect(self.RenderTick)
+
+        # the counter is only marked dirty here and repainted on the next tick, so a burst of requests only causes one repaint.
+        self.counterDirty = False
+        serverSignals.counterChanged.connect(self.ScheduleCounterRepaint)  # connects the server signal to the repaint scheduler.
 
         # this section initializes the sound library, sets path to sound and sets the volume to high.
         self.soundEffect = QSoundEffect()
@@ -141,60 +924,100 @@ class CombinedApp(QMainWindow):
         self.soundEffect.setSource(url)
         self.soundEffect.setVolume(1.0)
 
-        # This section sets up the flash timer that shows when the ah counter increments. Sets it to only flash one time and connects the ending timer to a function.
-        self.flashDurationTimer = QTimer()
-        self.flashDurationTimer.setSingleShot(True)
-        self.flashDurationTimer.timeout.connect(self.StopFlash)
-
-        # This timer handles the blinking effect speed when the warning happens.
-        self.flashToggleTimer = QTimer()
-        self.flashToggleTimer.timeout.connect(self.ToggleColor)
-        self.isFlashRed = False
-
+        # the counter label flashes red/black for FLASH_SECONDS after an increment, worked out from the render tick's clock.
+        self.flashStart = 0.0
+        self.flashUntil = 0.0
 
         # connects the start presentation button to the toggle function.
         self.StartPresentationButton.clicked.connect(self.TogglePresentation)
 
-        # this timer counts down every second for the presentation timer.
-        self.presentationTimer = QTimer()
-        self.presentationTimer.timeout.connect(self.UpdatePresentationTimer)
-        self.presentationTimer.setInterval(1000)
-
-        # this timer handles the blinking for the orange/red alerts.
-        self.blinkTimer = QTimer()
-        self.blinkTimer.timeout.connect(self.BlinkTimeLabel)
-        self.blinkTimer.setInterval(500)
-
         # variables to store the state of the presentation.
         self.isPresentationRunning = False
         self.timeRemaining = 0
         self.initialDuration = 0  # Track initial time for the summary popup
+        self.presentationTimer = None  # the PresentationTimer working out the time left from its deadline.
         self.alert1Time = -1
         self.alert2Time = -1
-        self.blinkState = False
-        self.blinkMode = None
+        self.blinkMode = None  # None, 'ORANGE' or 'RED'.
+        self.blinkStart = 0.0
+        self.orangeUntil = 0.0  # when the orange alert stops blinking.
+        self.timeLabelStyle = ""  # the time label's style when it isn't blinking.
         self.previousTimeLabelText = ""
 
 
-        self.cap = cv2.VideoCapture(0)  # capture the first frame from the webcam.
-        if not self.cap.isOpened():  # cancel if the webcam is not open.
-            return
+        self.frameRenderer = FrameRenderer()  # reuses the preview buffers from frame to frame.
+
+        # this label sits on top of the camera preview and shows the stage timings. F3 turns it on and off.
+        self.metricsOverlay = QLabel(self.imageLabel)
+        self.metricsOverlay.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace; padding: 4px;")
+        self.metricsOverlay.move(8, 8)
+        self.metricsOverlay.hide()
+        self.metricsShortcut = QShortcut(QKeySequence("F3"), self)
+        self.metricsShortcut.activated.connect(self.ToggleMetricsOverlay)
+        self.pauseShortcut = QShortcut(QKeySequence("Ctrl+P"), self)  # pauses and resumes the presentation timer.
+        self.pauseShortcut.activated.connect(self.TogglePause)
+        self.renderTimeTotal = 0.0  # adds up how long rendering took so the average can be shown next to the FPS.
 
         self.fpsFrameCount = 0  # count how many frames were displayed per second.
         self.fpsStartTime = time.time()  # gets the current time right when the class is called.
 
-        self.detector = FER(mtcnn=True)  # utilizes the FER facial recognition.
-        self.emotionTimer = time.time()  # gets the current time when the facial recognition first gets utilized.
+        # decides which frames get sent for facial recognition. the inference processes run side by side, so each one adds its budget.
+        workers = max(1, INFERENCE_PROCESSES) if FRAME_PIPELINE == 'processes' else 1
+        self.detectionScheduler = DetectionScheduler(EMOTION_CPU_BUDGET * workers)
         self.lastDetectionResult = []  # this will store the facial analysis data.
+        self.smoothedHappyScore = None  # moving average of the happy score so the feedback doesn't flicker.
+        self.audienceSummary = None  # in audience mode, the AggregateAudience numbers for the latest detection.
+        self.emotionSamples = 0  # emotion readings during the current presentation, for the smile ratio in the session history.
+        self.smileSamples = 0  # how many of them were at or above HAPPY_THRESHOLD.
+
+        self.modelState = 'loading'  # 'loading', 'ready' or 'failed', shown in the emotion label until the model is ready.
+        self.firstFrameTime = None  # seconds from startup until the first frame was shown.
+        self.firstEmotionTime = None  # seconds from startup until the first emotion feedback was shown.
+        self.labelPainter.Set(self.emotionLabel, "Loading emotion model...", "background-color: gray; color: white;")
+
+        self.UpdateCounterLabel(counterStore.Get())
+        self.renderTimer.start()
+
+        # the video source is opened right after the window has been shown, since opening a camera can take a moment.
+        self.cap = None
+        self.captureThread = None
+        self.inferenceWorker = None
+        QTimer.singleShot(0, self.StartVideo)
+
+    # this function opens the configured video source (the first webcam by default) and starts the capture and inference threads.
+    # without a video source the rest of the app still works.
+    def StartVideo(self):
+        self.captureSource = CaptureSource()
+        if FRAME_PIPELINE == 'processes':
+            self.StartProcessPipeline()
+            return
 
-        # this timer calls the UpdateFrame function as fast as possible to make the video look smooth.
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.UpdateFrame)
-        self.timer.start(0)
-
-        self.UpdateCounterLabel(appState['counter'])
-        self.StopFlash()
+        self.cap = self.captureSource.Open()
+        if self.cap is None:
+            self.imageLabel.setText(f"Could not open video source: {self.captureSource.source}")
+            return
 
+        # starts the inference worker, which loads the FER facial recognition in the background and then runs the emotion detection.
+        self.inferenceWorker = InferenceWorker(EmotionDetector)
+        self.inferenceWorker.resultReady.connect(self.OnDetectionResult)
+        self.inferenceWorker.modelReady.connect(self.OnModelReady)
+        self.inferenceWorker.start()
+
+        # the capture thread reads the video source at its own rate and calls UpdateFrame whenever a new frame is ready.
+        self.captureThread = CaptureThread(self.cap, playbackFps=self.captureSource.PlaybackFps(self.cap))
+        self.captureThread.frameReady.connect(self.UpdateFrame)
+        self.captureThread.start()
+
+    # this function starts the multi-process pipeline instead. it stands in for both the capture thread and the inference worker.
+    def StartProcessPipeline(self):
+        self.cap = None  # the camera is opened inside the capture process.
+        self.processPipeline = ProcessPipeline(self.captureSource, EmotionDetector)
+        self.processPipeline.frameReady.connect(self.UpdateFrame)
+        self.processPipeline.resultReady.connect(self.OnDetectionResult)
+        self.processPipeline.modelReady.connect(self.OnModelReady)
+        self.processPipeline.sourceFailed.connect(self.imageLabel.setText)
+        self.processPipeline.start()
+        self.captureThread = self.processPipeline
 
     # this function gets called when the button is clicked and decides whether to start or stop based on current state.
     def TogglePresentation(self):
@@ -237,17 +1060,26 @@ class CombinedApp(QMainWindow):
 
         #if not a number of in right format, throws an error.
         except ValueError:
-            self.TimeLeftLabel.setText("Invalid Time Format")
+            self.labelPainter.Set(self.TimeLeftLabel, "Invalid Time Format")
             return
 
         # Reset Counter Logic back to 0 for the new presentation.
-        appState['counter'] = 0
-        serverSignals.updateCounter.emit(appState['counter'])
+        counterStore.Reset()
+
+        # starts a new event log for this presentation in the sessions folder next to this script.
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        sessionDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions')
+        sessionLog.Start(os.path.join(sessionDir, f"session_{timestamp}.sanelog"))
+        sessionLog.Log(EVENT_RESET, 0)
 
         # updates state variables
         self.isPresentationRunning = True
         self.initialDuration = total_seconds  # Store this so we can calculate total time later
         self.timeRemaining = total_seconds
+        self.presentationTimer = PresentationTimer(total_seconds, (self.alert1Time, self.alert2Time))
+        self.presentationTimer.Start()
+        self.emotionSamples = 0
+        self.smileSamples = 0
 
         # greys out the input boxes so they cant be changed while running.
         self.PresentationLengthEdit.setEnabled(False)
@@ -257,23 +1089,25 @@ class CombinedApp(QMainWindow):
         # changes button text to Stop
         self.StartPresentationButton.setText("Stop Presentation")
 
-        self.UpdateTimerLabelDisplay()
-        self.presentationTimer.start()  # starts the countdown.
+        self.UpdateTimerLabelDisplay()  # the render tick counts down from here.
 
     # this function gets called to stop the presentation. it opens the summary popup and resets the UI for the next run
     def StopPresentation(self):
 
+        self.timeRemaining = self.presentationTimer.SecondsLeft()  # the time left right now, not at the last tick.
+        self.presentationTimer = None
+
         # We launch the popup here passing: Initial Time, Time Left, and Counter
-        self.summaryPopup = SummaryPopup(self.initialDuration, self.timeRemaining, appState['counter'])
+        self.summaryPopup = SummaryPopup(self.initialDuration, self.timeRemaining, counterStore.Get(),
+                                         self.emotionSamples, self.smileSamples)
         self.summaryPopup.show()
 
-        # Resets Timer Logic and stops blinking
-        self.presentationTimer.stop()
-        self.blinkTimer.stop()
+        sessionLog.Stop()  # writes out the rest of the event log.
 
+        # Resets Timer Logic and stops blinking
         self.isPresentationRunning = False
         self.blinkMode = None
-        self.TimeLeftLabel.setStyleSheet("")
+        self.timeLabelStyle = ""
 
         # re-enables the input boxes.
         self.PresentationLengthEdit.setEnabled(True)
@@ -284,68 +1118,80 @@ class CombinedApp(QMainWindow):
 
     # this function handles the invalid time alert, flashing the time label red for 5 seconds to warn the user.
     def TriggerInvalidTimeAlert(self):
-        current_text = self.TimeLeftLabel.text()
+        current_text = self.labelPainter.Text(self.TimeLeftLabel)
         # save the current text so we can put it back later.
         if current_text != "Please insert length of presentation":
             self.previousTimeLabelText = current_text
 
-        self.TimeLeftLabel.setText("Please insert length of presentation")
-        self.TimeLeftLabel.setStyleSheet("background-color: red; color: white;")
+        self.labelPainter.Set(self.TimeLeftLabel, "Please insert length of presentation")
+        self.timeLabelStyle = "background-color: red; color: white;"
         QTimer.singleShot(5000, self.ResetTimeLabelError)
 
     # this function resets the time label error message back to normal after the 5 second timeout.
     def ResetTimeLabelError(self):
         if not self.isPresentationRunning:
-            self.TimeLeftLabel.setText(self.previousTimeLabelText)
-            self.TimeLeftLabel.setStyleSheet("")
+            self.labelPainter.Set(self.TimeLeftLabel, self.previousTimeLabelText)
+            self.timeLabelStyle = ""
 
-    # this function is called every second by the timer to decrement the time remaining and check for alerts.
-    def UpdatePresentationTimer(self):
-        self.timeRemaining -= 1
-        self.UpdateTimerLabelDisplay()
+    # this function is called by the render tick to read the time left off the presentation timer and check for alerts.
+    # the time left comes from the timer's deadline, so however late a tick is the countdown stays on real time.
+    def UpdatePresentationTimer(self, now):
+        self.timeRemaining = self.presentationTimer.SecondsLeft(now)
+        dueAlerts, overtime = self.presentationTimer.DueAlerts(now)
 
-        # checks if we hit one of the warning times.
-        if self.timeRemaining == self.alert1Time or self.timeRemaining == self.alert2Time:
-            self.TriggerOrangeAlert()
+        # checks if we hit one of the warning times (or passed it while the GUI was busy).
+        if dueAlerts:
+            self.TriggerOrangeAlert(now)
 
         # checks if we ran out of time.
-        if self.timeRemaining <= 0:
-            if self.blinkMode != 'RED':
-                self.blinkMode = 'RED'
-                if not self.blinkTimer.isActive():
-                    self.blinkTimer.start()
-
-    # this function starts the orange blinking alert for warning times.
-    def TriggerOrangeAlert(self):
+        if overtime:
+            self.blinkMode = 'RED'
+            self.blinkStart = now
+        self.UpdateTimerLabelDisplay()
+
+    # this function pauses or resumes the presentation timer (Ctrl+P).
+    def TogglePause(self):
+        if not self.isPresentationRunning:
+            return
+        if self.presentationTimer.IsPaused():
+            self.presentationTimer.Resume()
+        else:
+            self.presentationTimer.Pause()
+        self.UpdateTimerLabelDisplay()
+
+    # this function starts the orange blinking alert for warning times, it stops after ORANGE_ALERT_SECONDS.
+    def TriggerOrangeAlert(self, now):
         self.blinkMode = 'ORANGE'
-        if not self.blinkTimer.isActive():
-            self.blinkTimer.start()
-        QTimer.singleShot(5000, self.StopOrangeAlert)  # stops it after 5 seconds.
-
-    # this function stops the orange alert and resets the color.
-    def StopOrangeAlert(self):
-        if self.blinkMode == 'ORANGE':
-            self.blinkMode = None
-            self.blinkTimer.stop()
-            self.TimeLeftLabel.setStyleSheet("")
-
-    # this function toggles the background color of the time label for blinking effects (Red or Orange).
-    def BlinkTimeLabel(self):
-        self.blinkState = not self.blinkState
-
-        if self.blinkMode == 'RED':
-            if self.blinkState:
-                self.TimeLeftLabel.setStyleSheet("background-color: red; color: white;")
-            else:
-                self.TimeLeftLabel.setStyleSheet("background-color: transparent; color: black;")
+        self.blinkStart = now
+        self.orangeUntil = now + ORANGE_ALERT_SECONDS
 
-        elif self.blinkMode == 'ORANGE':
-            if self.blinkState:
-                self.TimeLeftLabel.setStyleSheet("background-color: orange; color: white;")
-            else:
-                self.TimeLeftLabel.setStyleSheet("background-color: transparent; color: black;")
+    # this function works out the blink and flash colors for this tick, the label painter skips them if they didn't change.
+    def PaintEffects(self, now):
+        isFlashRed = now < self.flashUntil and int((now - self.flashStart) / FLASH_TOGGLE_SECONDS) % 2 == 0
+        self.labelPainter.Set(self.CounterLabel, style=COUNTER_FLASH_STYLE if isFlashRed else COUNTER_STYLE)
+
+        if self.blinkMode == 'ORANGE' and now >= self.orangeUntil:
+            self.blinkMode = None  # the orange alert is over.
+
+        if self.blinkMode is None:
+            style = self.timeLabelStyle
+        elif int((now - self.blinkStart) / BLINK_TOGGLE_SECONDS) % 2 == 0:
+            style = f"background-color: {self.blinkMode.lower()}; color: white;"
         else:
-            self.TimeLeftLabel.setStyleSheet("")
+            style = "background-color: transparent; color: black;"
+        self.labelPainter.Set(self.TimeLeftLabel, style=style)
+
+    # this function is the one clock for the GUI: it repaints the counter if it changed, counts the presentation down,
+    # works out the blink and flash effects, and then applies whatever labels changed.
+    def RenderTick(self):
+        with metrics.Time('ui_tick'):
+            now = time.monotonic()
+            if self.counterDirty:
+                self.RepaintCounter(now)
+            if self.isPresentationRunning:
+                self.UpdatePresentationTimer(now)
+            self.PaintEffects(now)
+            self.labelPainter.Flush()
 
     # this function formats the remaining time into MM:SS and updates the label on screen.
     def UpdateTimerLabelDisplay(self):
@@ -355,9 +1201,10 @@ class CombinedApp(QMainWindow):
         time_str = f"{mins:02}:{secs:02}"
 
         if self.timeRemaining < 0:
-            self.TimeLeftLabel.setText(f"-{time_str}")
-        else:
-            self.TimeLeftLabel.setText(time_str)
+            time_str = f"-{time_str}"
+        if self.presentationTimer is not None and self.presentationTimer.IsPaused():
+            time_str += " (paused)"
+        self.labelPainter.Set(self.TimeLeftLabel, time_str)
 
     # this function parses the time input string into total seconds, handling both MM:SS and raw minutes.
     def ParseTimeInput(self, text):
@@ -380,87 +1227,123 @@ class CombinedApp(QMainWindow):
                 return -1  # Return -1 if not a number
 
 
-    @pyqtSlot(int)
-    # this function updates the counter label on the GUI when the signal is received from the server thread.
+    @pyqtSlot()
+    # this function is called when the server thread changes the counter. the next render tick repaints it.
+    def ScheduleCounterRepaint(self):
+        self.counterDirty = True
+
+    # this function reads the latest counter value from the store and repaints the label once, flashing if there were any increments.
+    def RepaintCounter(self, now):
+        self.counterDirty = False
+        value, increments = counterStore.TakeUiUpdate()
+        self.UpdateCounterLabel(value)
+        if increments > 0:
+            self.StartFlash(now)
+            self.PlaySound()
+
+    # this function updates the counter label on the GUI.
     def UpdateCounterLabel(self, newValue):
-        self.CounterLabel.setText(f"{newValue}")
+        self.labelPainter.Set(self.CounterLabel, f"{newValue}")
 
     @pyqtSlot()
     # this function plays the ding sound effect.
     def PlaySound(self):
         self.soundEffect.play()
 
-    @pyqtSlot()
-    # this function starts the red flash on the counter label.
-    def StartFlash(self):
-        self.flashDurationTimer.start(3000)
-        if not self.flashToggleTimer.isActive():
-            self.isFlashRed = True
-            self.SetRedStyle()
-            self.flashToggleTimer.start(200)
-
-    # this function toggles the red/black colors for the flashing effect.
-    def ToggleColor(self):
-        if self.isFlashRed:
-            self.SetDefaultStyle()
-        else:
-            self.SetRedStyle()
-        self.isFlashRed = not self.isFlashRed
-
-    # this function stops the flashing effect and resets the style.
-    def StopFlash(self):
-        self.flashToggleTimer.stop()
-        self.SetDefaultStyle()
-        self.isFlashRed = False
-
-    # helper to set the label to red.
-    def SetRedStyle(self):
-        self.CounterLabel.setStyleSheet("background-color: red; color: black;")
+    # this function starts (or extends) the red flash on the counter label, PaintEffects does the actual blinking.
+    def StartFlash(self, now):
+        if now >= self.flashUntil:
+            self.flashStart = now  # a new flash starts on red, one that is still going keeps its rhythm.
+        self.flashUntil = now + FLASH_SECONDS
+
+
+    @pyqtSlot(bool)
+    # this function is called once the inference worker has loaded the model (or failed to).
+    def OnModelReady(self, isLoaded):
+        self.modelState = 'ready' if isLoaded else 'failed'
+        if not isLoaded:
+            self.labelPainter.Set(self.emotionLabel, "Emotion model unavailable", "background-color: gray; color: white;")
+
+    @pyqtSlot(list, float)
+    # this function stores the latest result sent back from the inference worker and updates the smoothed happy score.
+    def OnDetectionResult(self, result, cost):
+        self.detectionScheduler.RecordCost(cost)
+        self.lastDetectionResult = result
+        if not result:
+            self.smoothedHappyScore = None  # starts over when the face is lost.
+            return
 
-    # helper to reset the label to default black.
-    def SetDefaultStyle(self):
-        self.CounterLabel.setStyleSheet("background-color: #000000; color: white;")
+        if self.firstEmotionTime is None:
+            self.firstEmotionTime = time.monotonic() - APP_START_TIME
+            self.ShowStartupTimes()
 
+        if AUDIENCE_MODE:
+            # the whole room is scored, and its average happy score is what gets smoothed and logged.
+            self.audienceSummary = AggregateAudience(result)
+            happyScore = self.audienceSummary['happyMean']
+        else:
+            happyScore = result[0]['emotions']['happy'] * 100  # converts to percentage
+        sessionLog.Log(EVENT_EMOTION, happyScore)
+        if self.isPresentationRunning:
+            self.emotionSamples += 1
+            self.smileSamples += happyScore >= HAPPY_THRESHOLD
+        if self.smoothedHappyScore is None:
+            self.smoothedHappyScore = happyScore
+        else:
+            self.smoothedHappyScore += HAPPY_SMOOTHING * (happyScore - self.smoothedHappyScore)
 
-    # this function is called every frame to capture video, detect emotions, and update the display.
+    @pyqtSlot()
+    # this function is called for every new frame from the capture thread to detect emotions and update the display.
     def UpdateFrame(self):
-        ret, frame = self.cap.read()  # gets the frame from the screen capture.
-        if not ret:
+        frame, capturedAt = self.captureThread.TakeFrame()  # gets the newest frame from the capture thread.
+        if frame is None:
             return
+        cameraFrame = frame
 
+        renderStart = time.perf_counter()
         if self.mirrorCheckBox.isChecked():  # if the mirrored checkbox is checked, the
-            frame = cv2.flip(frame, 1)  # frame that was just captured will be flipped.
+            frame = self.frameRenderer.Mirror(frame)  # frame that was just captured will be flipped.
 
-        image = cv2.cvtColor(frame,cv2.COLOR_BGR2RGB)  # converts the image into something that can be displayed by the UI.
-        h, w, ch = image.shape  # gets the different data about the image shape.
-        bytesPerLine = ch * w  # calculates the bytes per line needed for the QImage.
-        qtImage = QImage(image.data, w, h, bytesPerLine, QImage.Format_RGB888)  # gets the QImage
-        pixmap = QPixmap.fromImage(qtImage)  # converts the qtImage into a piximap.
+        # scales the frame to the label and converts it into a pixmap that can be displayed by the UI.
+        pixmap = self.frameRenderer.Render(frame, self.imageLabel.width(), self.imageLabel.height())
+        self.renderTimeTotal += time.perf_counter() - renderStart
 
         self.fpsFrameCount += 1  # this increases the frame counter by one.
         currentTime = time.time()  # this gets the current time during this frame.
 
-        if currentTime - self.emotionTimer >= 2:
-            #waits every 2 seconds to do the facials recognition.
-            self.lastDetectionResult = self.detector.detect_emotions(frame)
-            self.emotionTimer = currentTime
-
-        if self.lastDetectionResult:  # Checks for detection
-            firstFace = self.lastDetectionResult[0]  # this gets the last detection result data.
-            emotions = firstFace['emotions']  # this will only get the emotions data.
-            happyScore = emotions['happy'] * 100  # converts to percentage
-
-            # Updates the emotional data based off of threashold constant.
-            if happyScore >= HAPPY_THRESHOLD:
-                self.emotionLabel.setText("Good job, keep smiling!")
-                self.emotionLabel.setStyleSheet("background-color: green; color: white;")
+        if self.detectionScheduler.ShouldDetect(frame, time.monotonic()):
+            # sends the frame for facial recognition when the scheduler says it's worth it, the worker thread does the actual work.
+            if self.inferenceWorker is None:
+                self.processPipeline.SubmitTakenFrame()  # the inference processes read this frame from shared memory themselves.
+            else:
+                # the frame is copied because the capture buffers get reused by the next frame.
+                self.inferenceWorker.SubmitFrame(frame.copy())
+
+        if self.firstFrameTime is None:
+            self.firstFrameTime = time.monotonic() - APP_START_TIME
+            self.ShowStartupTimes()
+
+        if self.modelState != 'ready':
+            pass  # the label keeps showing that the model is loading (or unavailable).
+        elif AUDIENCE_MODE and self.smoothedHappyScore is not None:
+            summary = self.audienceSummary
+            histogram = ' '.join(str(count) for count in summary['histogram'])
+            color = 'green' if self.smoothedHappyScore >= HAPPY_THRESHOLD else 'red'
+            self.labelPainter.Set(self.emotionLabel,
+                                  f"Audience: {summary['faces']} faces, {summary['smilingPercent']:.0f}% smiling, "
+                                  f"happy {self.smoothedHappyScore:.0f}, engagement {summary['engagement']:.0f}%\n"
+                                  f"Happy 0-100: [{histogram}]",
+                                  f"background-color: {color}; color: white;")
+        elif self.smoothedHappyScore is not None:  # Checks for detection
+            # Updates the emotional data based off of threashold constant, using the smoothed score.
+            # the label painter only touches the label when the text or color actually changes.
+            if self.smoothedHappyScore >= HAPPY_THRESHOLD:
+                self.labelPainter.Set(self.emotionLabel, "Good job, keep smiling!", "background-color: green; color: white;")
             else:
-                self.emotionLabel.setText("Smile more!")
-                self.emotionLabel.setStyleSheet("background-color: red; color: white;")
+                self.labelPainter.Set(self.emotionLabel, "Smile more!", "background-color: red; color: white;")
         else:
             # Fallback if no face is detected
-            self.emotionLabel.setText("Scanning for face...")
-            self.emotionLabel.setStyleSheet("background-color: gray; color: white;")
+            self.labelPainter.Set(self.emotionLabel, "Scanning for face...", "background-color: gray; color: white;")
 
         elapsedTime = currentTime - self.fpsStartTime
         # this line returns the time since the first frame was captured.
@@ -468,23 +1351,107 @@ class CombinedApp(QMainWindow):
         if elapsedTime >= 1:
             # checks if the time since the first frame is more then 1 second
             fps = self.fpsFrameCount / elapsedTime  # this calculates how many frames there was in one second.
-            self.fpsLabel.setText(f"FPS: {fps: .2f}")
+            renderMs = self.renderTimeTotal / self.fpsFrameCount * 1000  # average time spent rendering each frame.
+            self.labelPainter.Set(self.fpsLabel, f"FPS: {fps: .2f}  render: {renderMs:.1f} ms")
             self.fpsFrameCount = 0
             self.fpsStartTime = currentTime
-
-
-        # sets scaling parameters.
-        self.imageLabel.setPixmap(pixmap.scaled(self.imageLabel.size(), Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation))
+            self.renderTimeTotal = 0.0
+            if self.metricsOverlay.isVisible():  # the overlay only needs to refresh once a second too.
+                self.UpdateMetricsOverlay()
+
+
+        # the pixmap already matches the label size, so it is set as is.
+        self.imageLabel.setPixmap(pixmap)
+        self.captureThread.ReturnFrame(cameraFrame)  # the pixmap has its own copy now, so the buffer can be reused.
+        metrics.Record('capture_to_display', time.monotonic() - capturedAt)  # the part of the glass-to-glass delay we can see.
+
+    # this function shows how long startup took in the status bar and the console.
+    def ShowStartupTimes(self):
+        message = f"Time to first frame: {self.firstFrameTime:.2f} s"
+        if self.firstEmotionTime is not None:
+            message += f"   Time to first emotion: {self.firstEmotionTime:.2f} s"
+        self.statusBar().showMessage(message)
+        print(message)
+
+    # this function shows or hides the stage timing overlay.
+    def ToggleMetricsOverlay(self):
+        self.metricsOverlay.setVisible(not self.metricsOverlay.isVisible())
+        if self.metricsOverlay.isVisible():
+            self.UpdateMetricsOverlay()
+
+    # this function refreshes the text in the stage timing overlay.
+    def UpdateMetricsOverlay(self):
+        self.metricsOverlay.setText(metrics.ToOverlayText())
+        self.metricsOverlay.adjustSize()
 
     # this function ensures the camera is released when the window closes.
     def closeEvent(self, event):
-        self.cap.release()
+        self.renderTimer.stop()
+        if self.captureThread is not None:
+            self.captureThread.Stop()
+        if self.inferenceWorker is not None:
+            self.inferenceWorker.Stop()
+        if self.cap is not None:
+            self.cap.release()
+        sessionLog.Stop()
         event.accept()
 
 
+# this function plays a video file through the same render and emotion steps UpdateFrame uses, as fast as it can, and prints
+# how fast each part went. the emotion detection is scheduled on the video's own clock, so every run over the same file
+# does exactly the same work and can be compared between changes without needing a camera.
+def RunReplayBenchmark(videoPath, displayWidth=960, displayHeight=540):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # QPixmap needs a QApplication, but no window is shown.
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    cap = cv2.VideoCapture(videoPath)
+    if not cap.isOpened():
+        print(f"Could not open video file {videoPath}")
+        return
+
+    videoFps = cap.get(cv2.CAP_PROP_FPS) or 30
+    framesPerDetection = max(1, round(videoFps * EMOTION_REFRESH_SECONDS))
+    renderer = FrameRenderer()
+    detector = EmotionDetector()
+
+    frameCount = 0
+    detectionCount = 0
+    buffer = None
+    start = time.perf_counter()
+    while True:
+        with metrics.Time('capture'):
+            ret, frame = cap.read(buffer)
+        if not ret:
+            break
+        buffer = frame
+
+        renderer.Render(renderer.Mirror(frame), displayWidth, displayHeight)
+        if frameCount % framesPerDetection == 0:
+            with metrics.Time('detect_emotions'):
+                detector.Analyze([frame], now=frameCount / videoFps)
+            detectionCount += 1
+        frameCount += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+
+    print(f"{frameCount} frames in {elapsed:.2f} s ({frameCount / elapsed:.1f} FPS), {detectionCount} emotion updates")
+    print(metrics.ToOverlayText())
+
+
 # main function, gets called when the python application gets ran.
+# python ServerMain.py --headless runs only the counter API (no camera, no window), which is handy for load testing
+# (it is started at the top of this file, before Qt and OpenCV are imported), and python ServerMain.py --replay talk.mp4
+# runs the frame pipeline benchmark on a recorded video.
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Presentation helper server.")
+    parser.add_argument('--headless', action='store_true', help="only run the counter API, without the camera or the window")
+    parser.add_argument('--replay', metavar='VIDEO', help="play a video file through the frame pipeline and print the timings")
+    args, qtArgs = parser.parse_known_args()
+
+    if args.replay:
+        RunReplayBenchmark(args.replay)
+        sys.exit(0)
+    app = QApplication(sys.argv[:1] + qtArgs)
     window = CombinedApp()
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
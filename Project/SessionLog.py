@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import struct
+import threading
+from collections import deque
+import numpy as np
+
+# the kinds of events that can be in a session log.
+EVENT_INCREMENT = 1  # value is how many "uh"s were added.
+EVENT_DECREMENT = 2  # value is how many were taken away.
+EVENT_EMOTION = 3  # value is the happy score in percent.
+EVENT_RESET = 4  # value is what the counter was reset to.
+
+FILE_MAGIC = b'SANELOG1'
+HEADER_FORMAT = '<8sdd'  # magic, wall clock time at the start, monotonic time at the start.
+RECORD_FORMAT = '<dBf'  # monotonic timestamp, event kind, value. every record is the same 13 bytes.
+RECORD_DTYPE = np.dtype([('time', '<f8'), ('kind', 'u1'), ('value', '<f4')])  # the same layout, for reading it back.
+FLUSH_INTERVAL = 0.5  # seconds between the background writes to disk.
+
+
+# This class writes a session's events to an append-only binary file.
+# Log() only appends to an in-memory deque, a background thread packs the records and writes them to disk every
+# FLUSH_INTERVAL seconds, so the server routes and the GUI never wait on the disk.
+class SessionLogger:
+    def __init__(self):
+        self.pending = deque()  # records waiting to be written, deque appends are safe from any thread.
+        self.file = None
+        self.thread = None
+        self.stopEvent = threading.Event()
+        self.lock = threading.Lock()  # only guards starting and stopping a session.
+
+    # this function opens a new log file and starts the writer thread. any session that is still open gets closed first.
+    def Start(self, path):
+        self.Stop()
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, 'wb')
+            self.file.write(struct.pack(HEADER_FORMAT, FILE_MAGIC, time.time(), time.monotonic()))
+            self.pending.clear()
+            self.stopEvent.clear()
+            self.thread = threading.Thread(target=self.Run, daemon=True)
+            self.thread.start()
+
+    # this function adds one event to the log. it does nothing if no session is open.
+    def Log(self, kind, value):
+        if self.file is not None:
+            self.pending.append((time.monotonic(), kind, value))
+
+    # this function writes whatever is left, closes the file and stops the writer thread.
+    def Stop(self):
+        with self.lock:
+            if self.thread is None:
+                return
+            self.stopEvent.set()
+            self.thread.join()
+            self.Flush()
+            self.file.close()
+            self.file = None
+            self.thread = None
+
+    # this function runs on the writer thread and flushes the pending records every FLUSH_INTERVAL seconds.
+    def Run(self):
+        while not self.stopEvent.wait(FLUSH_INTERVAL):
+            self.Flush()
+
+    # this function packs every pending record and appends them to the file in one write.
+    def Flush(self):
+        records = []
+        while self.pending:
+            records.append(struct.pack(RECORD_FORMAT, *self.pending.popleft()))
+        if records:
+            self.file.write(b''.join(records))
+            self.file.flush()
+
+
+# this function reads a session log into numpy arrays. times are in seconds since the session started.
+# it returns a dict with 'started' (wall clock time), 'time', 'kind' and 'value'.
+def LoadSession(path):
+    headerSize = struct.calcsize(HEADER_FORMAT)
+    with open(path, 'rb') as file:
+        magic, started, monotonicStart = struct.unpack(HEADER_FORMAT, file.read(headerSize))
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        data = file.read()
+
+    # a session that was cut off mid-write can end with part of a record, which is ignored.
+    usableBytes = len(data) - len(data) % RECORD_DTYPE.itemsize
+    records = np.frombuffer(data[:usableBytes], dtype=RECORD_DTYPE)
+    return {
+        'started': started,
+        'time': records['time'] - monotonicStart,
+        'kind': records['kind'],
+        'value': records['value'],
+    }
+
+
+# this function works out the uh count and how often they happened per minute, plus the average happy score.
+def SummarizeSession(session):
+    kinds = session['kind']
+    values = session['value']
+    duration = session['time'][-1] if len(session['time']) else 0.0
+    uhCount = values[kinds == EVENT_INCREMENT].sum() - values[kinds == EVENT_DECREMENT].sum()
+    happyScores = values[kinds == EVENT_EMOTION]
+    return {
+        'duration': float(duration),
+        'uhCount': int(uhCount),
+        'uhPerMinute': float(uhCount / duration * 60) if duration > 0 else 0.0,
+        'averageHappy': float(happyScores.mean()) if len(happyScores) else 0.0,
+    }
+
+
+# This runs when you execute the script, it prints a short summary of each session log given.
+# Example: python SessionLog.py sessions/session_2025-01-01_12-00-00.sanelog
+if __name__ == '__main__':
+    for logPath in sys.argv[1:]:
+        summary = SummarizeSession(LoadSession(logPath))
+        print(f"{logPath}: {summary['duration']:.0f} s, {summary['uhCount']} uh ({summary['uhPerMinute']:.2f}/min), "
+              f"average happy {summary['averageHappy']:.1f}%")
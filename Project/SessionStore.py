@@ -0,0 +1,175 @@
+import os
+import re
+import glob
+import getpass
+import sqlite3
+import argparse
+import datetime
+
+DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'  # how session dates are stored, text in this format sorts the same as the dates do.
+SUMMARY_PATTERN = 'presentation_summary_*.txt'  # the text files SummaryPopup.SaveToFile writes.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    presenter TEXT NOT NULL,
+    planned_seconds INTEGER NOT NULL,
+    actual_seconds INTEGER NOT NULL,
+    uh_count INTEGER NOT NULL,
+    emotion_samples INTEGER NOT NULL DEFAULT 0,
+    smile_samples INTEGER NOT NULL DEFAULT 0,
+    source TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+CREATE INDEX IF NOT EXISTS sessions_presenter ON sessions (presenter, started);
+"""
+
+
+# this function returns the name sessions are saved under: SANE_PRESENTER if it is set, otherwise the login name.
+def DefaultPresenter():
+    try:
+        return os.environ.get('SANE_PRESENTER') or getpass.getuser()
+    except Exception:
+        return 'presenter'
+
+
+# This class keeps every presentation's summary in one SQLite file so trends over many rehearsals can be worked out
+# with a single query instead of reading every summary text file. Dates and presenters are indexed, and the
+# aggregates are done by SQLite itself, so even thousands of sessions come back in a few milliseconds.
+# The emotion counts are stored rather than a ratio, so the smile ratio over many sessions is weighted correctly.
+class SessionStore:
+    def __init__(self, path=DATABASE_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    # this function saves one session. started is a datetime, it defaults to now. source is the summary text file the
+    # session is in, a source that is already in the store is skipped. it returns the new session's id, or None if skipped.
+    def Record(self, plannedSeconds, actualSeconds, uhCount, emotionSamples=0, smileSamples=0,
+               presenter=None, started=None, source=None):
+        started = started or datetime.datetime.now()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO sessions (started, presenter, planned_seconds, actual_seconds, uh_count, "
+                "emotion_samples, smile_samples, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (started.strftime(DATE_FORMAT), presenter or DefaultPresenter(), int(plannedSeconds), int(actualSeconds),
+                 int(uhCount), int(emotionSamples), int(smileSamples), source))
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    # this function links a saved session to the summary text file it was also written to, so importing that file
+    # later doesn't add the session a second time.
+    def SetSource(self, sessionId, source):
+        with self.connection:
+            self.connection.execute("UPDATE OR IGNORE sessions SET source = ? WHERE id = ?", (source, sessionId))
+
+    # this function builds the WHERE clause shared by the queries below.
+    @staticmethod
+    def Filter(presenter, since, until):
+        conditions, params = [], []
+        if presenter is not None:
+            conditions.append("presenter = ?")
+            params.append(presenter)
+        if since is not None:
+            conditions.append("started >= ?")
+            params.append(since.strftime(DATE_FORMAT))
+        if until is not None:
+            conditions.append("started < ?")
+            params.append(until.strftime(DATE_FORMAT))
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    # this function returns (day, sessions, uh per minute) for every day with sessions, oldest first.
+    def UhPerMinuteTrend(self, presenter=None, since=None, until=None):
+        where, params = self.Filter(presenter, since, until)
+        return self.connection.execute(
+            "SELECT substr(started, 1, 10) AS day, COUNT(*), "
+            "CASE WHEN SUM(actual_seconds) > 0 THEN SUM(uh_count) * 60.0 / SUM(actual_seconds) ELSE 0 END "
+            f"FROM sessions{where} GROUP BY day ORDER BY day", params).fetchall()
+
+    # this function returns the average number of seconds sessions ran over their planned length (on-time ones count as 0),
+    # and how many of them ran over.
+    def AverageOverrun(self, presenter=None, since=None, until=None):
+        where, params = self.Filter(presenter, since, until)
+        average, overruns = self.connection.execute(
+            "SELECT AVG(MAX(actual_seconds - planned_seconds, 0)), "
+            f"COALESCE(SUM(actual_seconds > planned_seconds), 0) FROM sessions{where}", params).fetchone()
+        return (average or 0.0), overruns
+
+    # this function returns the share (0 to 1) of all emotion readings that were at or above the happy threshold.
+    def SmileRatio(self, presenter=None, since=None, until=None):
+        where, params = self.Filter(presenter, since, until)
+        smiles, samples = self.connection.execute(
+            f"SELECT SUM(smile_samples), SUM(emotion_samples) FROM sessions{where}", params).fetchone()
+        return smiles / samples if samples else 0.0
+
+    # this function reads every presentation_summary_*.txt in a folder into the store. files that were imported
+    # before are skipped, so it is safe to run more than once. it returns how many sessions were added.
+    def ImportSummaries(self, folder, presenter=None):
+        added = 0
+        for path in sorted(glob.glob(os.path.join(folder, SUMMARY_PATTERN))):
+            try:
+                summary = ParseSummaryFile(path)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            if self.Record(summary['planned'], summary['actual'], summary['uhCount'], presenter=presenter,
+                           started=summary['date'], source=os.path.abspath(path)) is not None:
+                added += 1
+        return added
+
+    def Close(self):
+        self.connection.close()
+
+
+# this function turns "MM:SS" or "-MM:SS" back into seconds.
+def ParseDuration(text):
+    match = re.fullmatch(r'(-?)(\d+):(\d{2})', text.strip())
+    if match is None:
+        raise ValueError(f"bad time {text!r}")
+    seconds = int(match.group(2)) * 60 + int(match.group(3))
+    return -seconds if match.group(1) else seconds
+
+
+# this function reads one summary text file written by SummaryPopup.SaveToFile.
+def ParseSummaryFile(path):
+    fields = {}
+    with open(path) as file:
+        for line in file:
+            if ':' in line and not line.startswith('---'):
+                name, value = line.split(':', 1)
+                fields[name.strip()] = value.strip()
+    try:
+        return {
+            'date': datetime.datetime.strptime(fields['Date'], DATE_FORMAT),
+            'planned': ParseDuration(fields['Presentation Length Set']),
+            'actual': ParseDuration(fields['Actual Duration']),
+            'uhCount': int(fields['Total Uh Count']),
+        }
+    except KeyError as e:
+        raise ValueError(f"missing {e.args[0]}")
+
+
+# This runs when you execute the script, it imports old summaries or prints the aggregate stats.
+# Examples: python SessionStore.py import .        python SessionStore.py stats --presenter alex --since 2025-01-01
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Presentation session history.")
+    parser.add_argument('command', choices=['import', 'stats', 'trend'])
+    parser.add_argument('folder', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="where the presentation_summary_*.txt files are (import only)")
+    parser.add_argument('--database', default=DATABASE_PATH)
+    parser.add_argument('--presenter', help="only this presenter's sessions (import: who the imported sessions belong to)")
+    parser.add_argument('--since', type=datetime.datetime.fromisoformat, help="only sessions on or after this date")
+    parser.add_argument('--until', type=datetime.datetime.fromisoformat, help="only sessions before this date")
+    args = parser.parse_args()
+
+    store = SessionStore(args.database)
+    if args.command == 'import':
+        print(f"Imported {store.ImportSummaries(args.folder, args.presenter)} sessions into {args.database}")
+    elif args.command == 'trend':
+        for day, sessions, uhPerMinute in store.UhPerMinuteTrend(args.presenter, args.since, args.until):
+            print(f"{day}  {sessions:3} sessions  {uhPerMinute:6.2f} uh/min")
+    else:
+        overrun, overruns = store.AverageOverrun(args.presenter, args.since, args.until)
+        print(f"Average overrun: {overrun:.0f} s ({overruns} sessions over time)")
+        print(f"Smile ratio:     {store.SmileRatio(args.presenter, args.since, args.until) * 100:.1f}%")
+    store.Close()